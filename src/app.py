@@ -1,19 +1,100 @@
-from flask import Flask, render_template, request, jsonify
-import requests
+from flask import Flask, render_template, request, jsonify, Response, g
+from config import GRAPH_MAX_LIMIT, GRAPH_MAX_NODES, PROFILING_ENABLED
+from cache import get_cache, make_key
+from transport import sparql_request
+from scheduler import CircuitOpenError
+from singleflight import SingleFlight
+from graph_payload import GraphPayloads
+from mirror import default_mirror
+from query_templates import registry
+import os
+import threading
+import metrics
+from metrics import span, SamplingProfiler
 
 app = Flask(__name__)
 
 # Endpoint DBpedia
 DBPEDIA_ENDPOINT = "https://dbpedia.org/sparql"
+ACCEPT = "application/sparql-results+json"
 
-def execute_sparql(query):
-    headers = {"Accept": "application/sparql-results+json"}
-    response = requests.get(DBPEDIA_ENDPOINT, params={"query": query}, headers=headers)
+# Identical queries missing the cache at the same time share one upstream request
+sparql_flights = SingleFlight()
+
+# Prebuilt /api/graph-data responses, rebuilt only when the results change
+graph_payloads = GraphPayloads()
+
+# Local mirror of the example DBpedia queries, answering them and
+# /api/search; its saved copy is loaded on first use, syncing is started
+# by `python app.py` or done separately with `python mirror.py`
+_mirror = None
+_mirror_lock = threading.Lock()
+
+def get_mirror():
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = default_mirror()
+        return _mirror
+
+def execute_sparql(query, ttl=None):
+    with span("execute_sparql"):
+        return _execute_sparql(query, ttl)
+
+def execute_template(name, ttl=None, **values):
+    """Run a registered query template, from the mirror when it covers the values"""
+    results = get_mirror().answer_template(DBPEDIA_ENDPOINT, name, values, full_results=True)
+    if results is not None:
+        return results
+    return execute_sparql(registry.get(name).render(**values), ttl)
+
+def _execute_sparql(query, ttl):
+    results = get_mirror().answer(DBPEDIA_ENDPOINT, query, full_results=True)
+    if results is not None:
+        return results
+    # Errors are returned as-is but never cached
+    key = make_key(query, DBPEDIA_ENDPOINT, ACCEPT)
+    error = {}
+    def fetch():
+        results = sparql_flights.do(key, lambda: _fetch_sparql(query))
+        if "error" in results:
+            error.update(results)
+            return None
+        return results
+    results = get_cache().get_or_fetch(key, fetch, ttl)
+    return results if results is not None else error
+
+def _fetch_sparql(query):
+    try:
+        response = sparql_request(DBPEDIA_ENDPOINT, query, ACCEPT)
+    except (OSError, CircuitOpenError) as e:
+        return {"error": str(e)}
     if response.status_code == 200:
-        return response.json()
+        with span("json_decode"):
+            return response.json()
     else:
         return {"error": response.text}
 
+@app.before_request
+def start_profiler():
+    # ?profile=1 replaces the response with a sampled profile of the request
+    if PROFILING_ENABLED and request.args.get('profile'):
+        g.profiler = SamplingProfiler().start()
+
+@app.after_request
+def stop_profiler(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    return Response(profiler.stop().collapsed(), mimetype='text/plain')
+
+@app.teardown_request
+def discard_profiler(exc):
+    # after_request is skipped when the view raises, the sampler must still stop
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -23,51 +104,77 @@ def query():
     if request.method == 'POST':
         sparql_query = request.form['sparql_query']
         results = execute_sparql(sparql_query)
-        return render_template('results.html', results=results)
+        with span("render_template"):
+            return render_template('results.html', results=results)
     return render_template('query.html')
 
 @app.route('/graph', methods=['GET'])
 def graph():
-    query = """
-    PREFIX dbo: <http://dbpedia.org/ontology/>
-    SELECT DISTINCT ?city ?name ?population
-    WHERE {
-        ?city a dbo:City ;
-              dbo:country <http://dbpedia.org/resource/France> ;
-              rdfs:label ?name ;
-              dbo:populationTotal ?population .
-        FILTER(LANG(?name) = "fr")
-    }
-    LIMIT 50
-    """
-    results = execute_sparql(query)
+    results = execute_template('cities_by_country', country="http://dbpedia.org/resource/France",
+                               lang="fr", limit=50)
     return render_template('graph.html', results=results)
 
 @app.route('/api/graph-data', methods=['GET'])
 def graph_data():
-    query = """
-    PREFIX dbo: <http://dbpedia.org/ontology/>
-    SELECT DISTINCT ?city ?name ?population
-    WHERE {
-        ?city a dbo:City ;
-              dbo:country <http://dbpedia.org/resource/France> ;
-              rdfs:label ?name ;
-              dbo:populationTotal ?population .
-        FILTER(LANG(?name) = "fr")
-    }
-    LIMIT 10
-    """
-    results = execute_sparql(query)
+    # ?limit=N fetches more cities, ?detail=full disables aggregation of small ones
+    limit = max(1, min(request.args.get('limit', 10, type=int), GRAPH_MAX_LIMIT))
+    max_nodes = None if request.args.get('detail') == 'full' else GRAPH_MAX_NODES
+    results = execute_template('cities_by_country', country="http://dbpedia.org/resource/France",
+                               lang="fr", limit=limit)
     if "error" in results:
         return jsonify({"error": results["error"]}), 500
-    nodes = []
-    links = []
-    for result in results["results"]["bindings"]:
-        city = result["city"]["value"]
-        name = result["name"]["value"]
-        population = int(result["population"]["value"])
-        nodes.append({"id": city, "name": name, "population": population})
-    return jsonify({"nodes": nodes, "links": links})
+    etag, body, compressed = graph_payloads.get(
+        f"cities:{limit}", results["results"]["bindings"], max_nodes=max_nodes)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif request.accept_encodings['gzip']:
+        response = Response(compressed, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    # Weak ETag: the gzip and identity bodies are the same payload
+    response.set_etag(etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    # Labels of the mirrored data: ?q=words, optional ?lang=fr and ?limit=N
+    text = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    mirror = get_mirror()
+    if not mirror.last_sync:
+        # First sync still running (or failing), the index would be empty
+        response = jsonify({"error": "Search index not ready, the mirror has not been synced yet"})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+    with span("search"):
+        results = mirror.search_index().search(text, limit, request.args.get('lang'))
+    return jsonify({"query": text, "results": results})
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    return jsonify({"cache": get_cache().stats, "singleflight": sparql_flights.stats})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    cache_stats = get_cache().stats
+    # disk_hits are a subset of hits, stale hits are served from the cache too
+    hits = cache_stats['hits'] + cache_stats['stale_hits']
+    lookups = hits + cache_stats['misses']
+    extra = metrics.gauge_lines(
+        "sparql_cache_events", "Result cache events since start", cache_stats, 'event')
+    extra += metrics.gauge_lines(
+        "sparql_cache_hit_ratio", "Share of cache lookups answered from the cache",
+        {'all': hits / lookups if lookups else 0}, 'cache')
+    extra += metrics.gauge_lines(
+        "sparql_singleflight_calls", "Single-flight calls, executed and coalesced",
+        sparql_flights.stats, 'event')
+    return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
 
 if __name__ == "__main__":
+    # With the debug reloader only the child process serving requests syncs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        get_mirror().start()
     app.run(debug=True)
@@ -0,0 +1,173 @@
+"""Asyncio SPARQL clients for running independent queries concurrently"""
+
+import asyncio
+import contextlib
+
+import aiohttp
+
+from config import (DBPEDIA_ENDPOINT, WIKIDATA_ENDPOINT, DEFAULT_FORMAT, TIMEOUT,
+                    ASYNC_MAX_CONCURRENCY, MAX_GET_QUERY_LENGTH, USER_AGENT)
+from cache import resolve_cache, make_key
+from scheduler import default_scheduler
+
+
+class AsyncSPARQLClient:
+    """Async counterpart of SPARQLClient with a per-endpoint concurrency limit
+
+    Results are the JSON bindings (or the whole JSON document when
+    full_results is set). Failed or timed-out queries return None.
+    Queries routed to a synced local mirror are answered from it.
+    """
+
+    def __init__(self, endpoint, accept=DEFAULT_FORMAT, cache='default',
+                 timeout=TIMEOUT, max_concurrency=ASYNC_MAX_CONCURRENCY,
+                 full_results=False, mirror=None):
+        self.endpoint = endpoint
+        self.mirror = mirror
+        self.accept = accept
+        self.cache = resolve_cache(cache)
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.full_results = full_results
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+
+    async def __aenter__(self):
+        # Queries inside `async with client` share one session, closed on exit
+        self._bind_loop()
+        if self._session is None or self._session.closed:
+            self._session = self._new_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _new_session(self):
+        connector = aiohttp.TCPConnector(limit_per_host=self.max_concurrency)
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers={"Accept-Encoding": "gzip, deflate", "User-Agent": USER_AGENT})
+
+    def _bind_loop(self):
+        # Semaphores belong to one event loop, recreate it when the client
+        # is reused from another asyncio.run() call. Sessions only live
+        # inside `async with client`, so none is left open on the old loop.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._session = None
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def query(self, query_string, timeout=None, ttl=None):
+        """Execute a SPARQL query, waiting at most timeout seconds"""
+        if self.mirror is not None:
+            results = self.mirror.answer(self.endpoint, query_string, self.full_results)
+            if results is not None:
+                return results
+        key = make_key(query_string, self.endpoint, self.accept)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        self._bind_loop()
+        try:
+            if self._session is None or self._session.closed:
+                # Outside `async with client` the query gets its own session
+                async with self._new_session() as session:
+                    results = await self._limited(session, query_string, timeout)
+            else:
+                results = await self._limited(self._session, query_string, timeout)
+        except asyncio.TimeoutError:
+            print(f"Query timed out after {self.timeout if timeout is None else timeout}s")
+            return None
+        except Exception as e:
+            # Includes malformed JSON or results, so one bad query does not
+            # fail the other queries gathered with it
+            print(f"Error executing query: {e}")
+            return None
+        if results is not None and self.cache is not None:
+            self.cache.set(key, results, ttl)
+        return results
+
+    async def _limited(self, session, query_string, timeout):
+        async with self._semaphore:
+            return await asyncio.wait_for(
+                self._execute(session, query_string),
+                self.timeout if timeout is None else timeout)
+
+    async def _execute(self, session, query_string):
+        # Same rate limiting and retry policy as the sync transport
+        attempt = 0
+        while True:
+            await asyncio.sleep(default_scheduler.before_request(self.endpoint))
+            try:
+                status, retry_after, data = await self._send(session, query_string)
+            except aiohttp.ClientConnectionError as e:
+                delay = default_scheduler.after_error(self.endpoint, attempt)
+                if delay is None:
+                    raise
+                print(f"Request failed ({e}), retrying in {delay:.1f}s")
+            else:
+                delay = default_scheduler.after_response(self.endpoint, status, retry_after, attempt)
+                if delay is None:
+                    if status != 200:
+                        print(f"Error {status}: {data}")
+                        return None
+                    return data if self.full_results else data['results']['bindings']
+                print(f"Error {status}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _send(self, session, query_string):
+        headers = {"Accept": self.accept}
+        if len(query_string) > MAX_GET_QUERY_LENGTH:
+            request = session.post(self.endpoint, data={"query": query_string}, headers=headers)
+        else:
+            request = session.get(self.endpoint, params={"query": query_string}, headers=headers)
+        async with request as response:
+            if response.status != 200:
+                return response.status, response.headers.get("Retry-After"), await response.text()
+            return response.status, None, await response.json(content_type=None)
+
+    async def query_many(self, queries, timeout=None):
+        """Execute queries concurrently and return their results in order
+
+        Cancelling the awaiting task cancels every query still in flight.
+        """
+        self._bind_loop()
+        if self._session is not None and not self._session.closed:
+            return await asyncio.gather(*(self.query(q, timeout) for q in queries))
+        async with self:
+            return await asyncio.gather(*(self.query(q, timeout) for q in queries))
+
+
+class AsyncDBPediaClient(AsyncSPARQLClient):
+    def __init__(self, endpoint=DBPEDIA_ENDPOINT, **kwargs):
+        super().__init__(endpoint, **kwargs)
+
+
+class AsyncWikidataClient(AsyncSPARQLClient):
+    def __init__(self, endpoint=WIKIDATA_ENDPOINT, **kwargs):
+        kwargs.setdefault("accept", "application/sparql-results+json")
+        super().__init__(endpoint, **kwargs)
+
+
+def run_queries(jobs, timeout=None):
+    """Run (client, query) pairs concurrently from synchronous code
+
+    Wall-clock time is that of the slowest query rather than the sum.
+    """
+    async def run():
+        clients = {id(client): client for client, _ in jobs}
+        # One session per client for this run, closed before the loop ends
+        async with contextlib.AsyncExitStack() as stack:
+            for client in clients.values():
+                await stack.enter_async_context(client)
+            return await asyncio.gather(*(client.query(q, timeout) for client, q in jobs))
+    return asyncio.run(run())
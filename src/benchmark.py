@@ -0,0 +1,301 @@
+"""Latency, throughput and memory benchmarks, fully offline
+
+Usage:
+    python benchmark.py [--sizes 1000 10000 100000] [--requests 200]
+                        [--concurrency 8] [--delay 0.01] [--rows 100]
+                        [--json results.json] [--baseline previous.json]
+
+The SPARQL clients and execute_sparql are run against a local fake
+endpoint serving a canned JSON result of --rows rows after --delay
+seconds. The rdf_utils load/save paths and the Streamlit OntologyIndex
+are run on generated ontologies of each size. Every case runs in its own
+process so the reported peak RSS belongs to that case only. With
+--baseline, cases whose p50 got slower than --tolerance are listed and
+the exit status is 1.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+STREAMLIT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit")
+EX = "http://example.org/bench/"
+
+
+class FakeEndpoint(ThreadingHTTPServer):
+    """SPARQL endpoint answering every query with the same canned result"""
+
+    daemon_threads = True
+
+    def __init__(self, rows=100, delay=0.0, port=0):
+        super().__init__(("127.0.0.1", port), FakeEndpointHandler)
+        self.delay = delay
+        self.body = json.dumps({
+            "head": {"vars": ["city", "name", "population"]},
+            "results": {"bindings": [{
+                "city": {"type": "uri", "value": f"{EX}city/{i}"},
+                "name": {"type": "literal", "xml:lang": "fr", "value": f"Ville {i}"},
+                "population": {"type": "typed-literal", "value": str(1000 + i),
+                               "datatype": "http://www.w3.org/2001/XMLSchema#integer"},
+            } for i in range(rows)]},
+        }).encode('utf-8')
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/sparql"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FakeEndpointHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, without TCP_NODELAY the body
+    # waits for the client's delayed ACK (~40 ms per request)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', "application/sparql-results+json")
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def generate_ontology(path, triples):
+    """Write an N-Triples file of roughly `triples` triples shaped like an ontology"""
+    rdf = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+    rdfs = "http://www.w3.org/2000/01/rdf-schema#"
+    owl = "http://www.w3.org/2002/07/owl#"
+    classes = max(1, triples // 1000)
+    with open(path, 'w', encoding='utf-8') as f:
+        for c in range(classes):
+            f.write(f'<{EX}Class{c}> <{rdf}type> <{owl}Class> .\n')
+            f.write(f'<{EX}Class{c}> <{rdfs}label> "Class {c}"@en .\n')
+        written = classes * 2
+        i = 0
+        while written < triples:
+            s = f"<{EX}item/{i}>"
+            f.write(f'{s} <{rdf}type> <{EX}Class{i % classes}> .\n')
+            f.write(f'{s} <{rdfs}label> "Item {i}"@en .\n')
+            f.write(f'{s} <{EX}rating> "{i % 5}"^^<http://www.w3.org/2001/XMLSchema#integer> .\n')
+            f.write(f'{s} <{EX}related> <{EX}item/{(i * 7) % (i + 1)}> .\n')
+            written += 4
+            i += 1
+    return written
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _requests(send, count, concurrency):
+    """Latency of each of `count` calls made from `concurrency` threads"""
+    def one(i):
+        start = time.perf_counter()
+        send(i)
+        return time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one, range(count)))
+    return samples, time.perf_counter() - start
+
+
+def _client_case(name, options):
+    # No client-side throttling against the local endpoint
+    from config import RATE_LIMITS
+    RATE_LIMITS["127.0.0.1"] = (1e9, 1e9)
+    url = options['url']
+    count, concurrency = options['requests'], options['concurrency']
+    if name == 'dbpedia_client':
+        from sparql_client import DBPediaClient
+        client = DBPediaClient(url, cache=None)
+        send = lambda i: client.query(f"SELECT * WHERE {{ ?s ?p ?o }} # {i}")
+    elif name == 'wikidata_client':
+        from wikidata_client import WikidataClient
+        client = WikidataClient(url, cache=None)
+        send = lambda i: client.query(f"SELECT * WHERE {{ ?s ?p ?o }} # {i}")
+    else:
+        import app
+        import cache
+        from mirror import Mirror
+        app.DBPEDIA_ENDPOINT = url
+        cache._default_cache = cache.ResultCache(path=None)
+        # Empty mirror, nothing synced from DBpedia during the benchmark
+        app._mirror = Mirror(directory=None)
+        if name == 'execute_sparql_cold':
+            send = lambda i: app.execute_sparql(f"SELECT * WHERE {{ ?s ?p ?o }} # {i}")
+        else:
+            send = lambda i: app.execute_sparql("SELECT * WHERE { ?s ?p ?o }")
+    samples, elapsed = _requests(send, count, concurrency)
+    return samples, count / elapsed, "req/s"
+
+
+def _data_case(name, options):
+    from rdflib import Graph
+    from rdf_utils import bulk_load, stream_save, save_graph, load_graph, save_snapshot
+    size, repeat, workdir = options['size'], options['repeat'], options['workdir']
+    source = os.path.join(workdir, f"onto-{size}.nt")
+    triples = generate_ontology(source, size)
+
+    def loaded():
+        graph = Graph()
+        bulk_load(graph, source)
+        return graph
+
+    if name == 'bulk_load':
+        samples = _timed(loaded, repeat)
+    elif name == 'stream_save':
+        graph = loaded()
+        samples = _timed(lambda: stream_save(graph, os.path.join(workdir, "out.nt")), repeat)
+    elif name == 'save_turtle':
+        graph = loaded()
+        samples = _timed(lambda: save_graph(graph, os.path.join(workdir, "out.ttl")), repeat)
+    elif name == 'load_turtle':
+        turtle = os.path.join(workdir, f"onto-{size}.ttl")
+        save_graph(loaded(), turtle)
+        samples = _timed(lambda: load_graph(turtle, snapshot=False), repeat)
+    elif name == 'load_snapshot':
+        turtle = os.path.join(workdir, f"onto-{size}.ttl")
+        graph = loaded()
+        save_graph(graph, turtle)
+        save_snapshot(graph, turtle + ".snap", turtle)
+        samples = _timed(lambda: load_graph(turtle, snapshot=True), repeat)
+    else:
+        sys.path.insert(0, STREAMLIT_DIR)
+        from ontology_index import OntologyIndex
+        graph = loaded()
+        samples = _timed(lambda: OntologyIndex(graph), repeat)
+    return samples, triples / percentile(samples, 50), "triples/s"
+
+
+CLIENT_CASES = ('dbpedia_client', 'wikidata_client', 'execute_sparql_cold', 'execute_sparql_warm')
+DATA_CASES = ('bulk_load', 'stream_save', 'save_turtle', 'load_turtle', 'load_snapshot',
+              'ontology_index')
+
+
+def _run_case(kind, name, options, conn):
+    try:
+        run = _client_case if kind == 'client' else _data_case
+        samples, throughput, unit = run(name, options)
+        conn.send({
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+            "throughput": throughput,
+            "unit": unit,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        })
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run_case(kind, name, options):
+    """Run one case in a fresh process and return its measurements"""
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_run_case, args=(kind, name, options, child))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {"error": f"process exited with code {process.exitcode}"}
+    process.join()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Cases whose p50 is slower than the baseline by more than tolerance"""
+    regressions = []
+    for case, result in results.items():
+        previous = baseline.get(case)
+        if previous and "p50" in result and "p50" in previous:
+            change = result["p50"] / previous["p50"] - 1
+            if change > tolerance:
+                regressions.append((case, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SPARQL clients and RDF utilities")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="Triples per generated ontology (e.g. 1000 ... 10000000)")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=0.01, help="Fake endpoint delay (s)")
+    parser.add_argument('--rows', type=int, default=100, help="Rows in the fake result")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs of each data case")
+    parser.add_argument('--only', nargs='+', help="Run only these cases")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Compare against a previous --json file")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    endpoint = FakeEndpoint(args.rows, args.delay).start()
+    results = {}
+    print(f"{'case':<32}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'throughput':>22}{'peak RSS MB':>14}")
+    with tempfile.TemporaryDirectory() as workdir:
+        jobs = [('client', name, name, {'url': endpoint.url, 'requests': args.requests,
+                                        'concurrency': args.concurrency})
+                for name in CLIENT_CASES]
+        jobs += [('data', name, f"{name}[{size}]",
+                  {'size': size, 'repeat': args.repeat, 'workdir': workdir})
+                 for size in args.sizes for name in DATA_CASES]
+        for kind, name, case, options in jobs:
+            if args.only and name not in args.only:
+                continue
+            result = results[case] = run_case(kind, name, options)
+            if "error" in result:
+                print(f"{case:<32}error: {result['error']}")
+                continue
+            print(f"{case:<32}{result['p50'] * 1000:>10.2f}{result['p95'] * 1000:>10.2f}"
+                  f"{result['p99'] * 1000:>10.2f}{result['throughput']:>12.0f} {result['unit']:<9}"
+                  f"{result['peak_rss_mb']:>14.1f}")
+    endpoint.shutdown()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for case, change in regressions:
+            print(f"Regression: {case} p50 is {change:.0%} slower than the baseline")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
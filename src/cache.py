@@ -0,0 +1,188 @@
+"""Result cache for SPARQL queries: in-memory LRU on top of a SQLite file"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import (CACHE_PATH, CACHE_TTL, CACHE_STALE_TTL,
+                    CACHE_MAX_ENTRIES, CACHE_MAX_DISK_ENTRIES)
+
+# Quoted strings are kept as-is, whitespace everywhere else is collapsed
+_STRING_RE = re.compile(r'("""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')')
+
+
+def normalize_query(query):
+    """Collapse whitespace outside of string literals"""
+    parts = _STRING_RE.split(query.strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r'\s+', ' ', parts[i])
+    return ''.join(parts).strip()
+
+
+def make_key(query, endpoint, accept):
+    """Build the cache key for a query sent to an endpoint"""
+    raw = f"{endpoint}\n{accept}\n{normalize_query(query)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Two-level TTL cache with stale-while-revalidate and hit/miss counters
+
+    Values are shared, not copied: the object returned by get() or
+    get_or_fetch(), or passed to set(), is the one kept in memory, so
+    callers must not modify it.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES,
+                 max_disk_entries=CACHE_MAX_DISK_ENTRIES, ttl=CACHE_TTL,
+                 stale_ttl=CACHE_STALE_TTL):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stats = {'hits': 0, 'disk_hits': 0, 'stale_hits': 0,
+                      'misses': 0, 'evictions': 0}
+        self._memory = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS results ("
+                    "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)")
+                self._db.execute(
+                    "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Error opening cache database: {e}")
+                self._db = None
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE results SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            entry = (json.loads(row[0]), row[1])
+            self._remember(key, entry)
+            # Expired rows are only a miss or a stale hit for the caller
+            if time.time() < entry[1]:
+                self.stats['disk_hits'] += 1
+            return entry
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get(self, key):
+        """Return the cached value if it has not expired, else None"""
+        entry = self._lookup(key)
+        with self._lock:
+            if entry is not None and time.time() < entry[1]:
+                self.stats['hits'] += 1
+                return entry[0]
+            self.stats['misses'] += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        """Store a JSON-serializable value for ttl seconds"""
+        now = time.time()
+        entry = (value, now + (self.ttl if ttl is None else ttl))
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), entry[1], now))
+            self._db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,))
+            self._db.commit()
+
+    def get_or_fetch(self, key, fetch, ttl=None):
+        """Return the cached value for key, calling fetch() on a miss
+
+        Expired entries still inside the stale window are returned immediately
+        while a background thread refreshes them. None results are not cached.
+        """
+        entry = self._lookup(key)
+        now = time.time()
+        if entry is not None:
+            value, expires_at = entry
+            if now < expires_at:
+                with self._lock:
+                    self.stats['hits'] += 1
+                return value
+            if now < expires_at + self.stale_ttl:
+                with self._lock:
+                    self.stats['stale_hits'] += 1
+                self._refresh(key, fetch, ttl)
+                return value
+        with self._lock:
+            self.stats['misses'] += 1
+        value = fetch()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+    def _refresh(self, key, fetch, ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                value = fetch()
+                if value is not None:
+                    self.set(key, value, ttl)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+
+# Shared cache, created on first use so importing this module opens no file
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_cache():
+    """The shared ResultCache used by clients created with cache='default'"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
+
+
+def resolve_cache(cache):
+    """Cache argument of a client: 'default' for the shared cache, None for no cache"""
+    return get_cache() if cache == 'default' else cache
@@ -1,5 +1,74 @@
 """Configuration settings for the DBPedia SPARQL endpoint"""
 
+import os
+
 DBPEDIA_ENDPOINT = "http://dbpedia.org/sparql"
+WIKIDATA_ENDPOINT = "https://query.wikidata.org/sparql"
+# DBpedia truncates any result at this many rows
+DBPEDIA_MAX_ROWS = 10000
 DEFAULT_FORMAT = "application/json"
-TIMEOUT = 30
\ No newline at end of file
+TIMEOUT = 30
+
+# Result cache (in-memory LRU on top of a SQLite file, None disables the disk layer)
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sparql_cache.db")
+CACHE_TTL = 3600
+CACHE_STALE_TTL = 600
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_DISK_ENTRIES = 10000
+
+# HTTP transport (one pooled keep-alive session per endpoint host)
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+MAX_GET_QUERY_LENGTH = 2000
+# Threads used by SPARQLClient.query_parallel, kept within the connection pool size
+QUERY_WORKERS = 8
+USER_AGENT = "Semantic-Web-Project/1.0 (https://github.com/sofexbk/Semantic-Web-Project)"
+
+# Batched entity lookups (lookup.py): URIs per VALUES query and parallel batches
+LOOKUP_BATCH_SIZE = 100
+LOOKUP_WORKERS = 4
+# Rows per lookup query, at most what DBpedia returns for one query
+LOOKUP_PAGE_SIZE = DBPEDIA_MAX_ROWS
+
+# Async client: maximum in-flight queries per endpoint
+ASYNC_MAX_CONCURRENCY = 4
+
+# Request scheduling: token bucket per endpoint host as (requests per second, burst)
+RATE_LIMITS = {
+    "query.wikidata.org": (5, 10),
+    "dbpedia.org": (10, 20),
+}
+DEFAULT_RATE_LIMIT = (10, 20)
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+# Graph view payloads (graph_payload.py): layout size and nodes shown before aggregating
+GRAPH_WIDTH = 800
+GRAPH_HEIGHT = 600
+GRAPH_MAX_NODES = 200
+GRAPH_MAX_LIMIT = 10000
+# Prebuilt payloads kept in memory (least recently used are dropped)
+GRAPH_MAX_PAYLOADS = 32
+
+# Metrics: ?profile=1 on a Flask request returns a sampled profile when enabled
+PROFILING_ENABLED = os.environ.get("SPARQL_PROFILING") == "1"
+PROFILE_INTERVAL = 0.005
+
+# Local SPARQL endpoint (sparql_server.py), port matches the Fuseki URL used by Project-JS
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 3030
+SERVER_WORKERS = 8
+QUERY_TIMEOUT = TIMEOUT
+# Idle keep-alive connections are closed after this many seconds
+SERVER_IDLE_TIMEOUT = 15
+
+# Local mirror of remote CONSTRUCT results (mirror.py)
+MIRROR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mirror")
+MIRROR_INTERVAL = 24 * 3600
+MIRROR_CHECK_INTERVAL = 60
+# CONSTRUCT solutions fetched per page; a page reaching DBPEDIA_MAX_ROWS
+# triples was truncated by the endpoint and fails the sync
+MIRROR_PAGE_SIZE = 1000
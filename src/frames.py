@@ -0,0 +1,107 @@
+"""Columnar (pandas/Arrow) tables from SPARQL JSON result bindings
+
+Each variable becomes one column typed from the bindings' datatypes:
+xsd integers as nullable Int64, decimals/doubles as float64, booleans,
+xsd:date/dateTime as datetime64 (second resolution, so historical dates
+fit), URIs as categoricals, and language-tagged literals as strings with
+an extra `<var>_lang` column. Columns with mixed kinds stay as strings.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+_XSD = "http://www.w3.org/2001/XMLSchema#"
+INTEGER_TYPES = {_XSD + t for t in (
+    'integer', 'int', 'long', 'short', 'byte', 'nonNegativeInteger', 'positiveInteger',
+    'nonPositiveInteger', 'negativeInteger', 'unsignedInt', 'unsignedLong',
+    'unsignedShort', 'unsignedByte')}
+FLOAT_TYPES = {_XSD + t for t in ('decimal', 'double', 'float')}
+DATE_TYPES = {_XSD + 'date', _XSD + 'dateTime', _XSD + 'gYear'}
+BOOLEAN_TYPE = _XSD + 'boolean'
+_DATE_RE = re.compile(r'^\+?(-?\d{4,})(?:-(\d{2})-(\d{2}))?')
+
+
+def _kind(term):
+    """Coarse type of a JSON result term: 'uri', 'bnode', 'date' or its datatype"""
+    if term['type'] in ('uri', 'bnode'):
+        return term['type']
+    datatype = term.get('datatype', '')
+    # xsd:date and xsd:dateTime mixed in one column still convert to datetime64
+    return 'date' if datatype in DATE_TYPES else datatype
+
+
+def _dates(values):
+    """datetime64[s] array from xsd:date/dateTime lexical forms, NaT if unparsable"""
+    # Time and timezone parts are dropped, the date is what results carry
+    days = [v[:10] if v is not None else 'NaT' for v in values]
+    try:
+        array = np.array(days, dtype='datetime64[D]')
+    except ValueError:
+        # Signed or long years (e.g. Wikidata's +1452-04-15) and xsd:gYear
+        array = np.array([_date(v) for v in values], dtype='datetime64[D]')
+    return pd.Series(array.astype('datetime64[s]'))
+
+
+def _date(value):
+    match = _DATE_RE.match(value or '')
+    if match is None:
+        return np.datetime64('NaT')
+    year, month, day = match.groups()
+    try:
+        return np.datetime64(f"{year}-{month or '01'}-{day or '01'}", 'D')
+    except ValueError:
+        return np.datetime64('NaT')
+
+
+def _column(terms, categorical):
+    values = [term['value'] if term is not None else None for term in terms]
+    kinds = {_kind(term) for term in terms if term is not None}
+    langs = None
+    if len(kinds) == 1:
+        kind = kinds.pop()
+        if kind in INTEGER_TYPES:
+            return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype('Int64'), None
+        if kind in FLOAT_TYPES:
+            return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype('float64'), None
+        if kind == BOOLEAN_TYPE:
+            return pd.Series([v in ('true', '1') if v is not None else None for v in values],
+                             dtype='boolean'), None
+        if kind == 'date':
+            return _dates(values), None
+        if kind == 'uri' and categorical:
+            return pd.Series(values, dtype='category'), None
+        if kind == '':
+            tags = [term.get('xml:lang') if term is not None else None for term in terms]
+            if any(tags):
+                langs = pd.Series(tags, dtype='category')
+    return pd.Series(values, dtype='string'), langs
+
+
+def bindings_to_frame(bindings, variables=None, categorical=True):
+    """pandas DataFrame with one typed column per variable
+
+    variables gives the column order (defaults to the order of first
+    appearance), categorical stores URI columns as pandas categoricals.
+    """
+    if variables is None:
+        variables = list(dict.fromkeys(var for row in bindings for var in row))
+    columns = {}
+    for var in variables:
+        column, langs = _column([row.get(var) for row in bindings], categorical)
+        columns[var] = column
+        if langs is not None:
+            columns[f"{var}_lang"] = langs
+    return pd.DataFrame(columns)
+
+
+def bindings_to_arrow(bindings, variables=None, categorical=True):
+    """pyarrow Table of the same columns (categoricals become dictionary arrays)"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        print("pyarrow is not installed, use bindings_to_frame instead")
+        return None
+    frame = bindings_to_frame(bindings, variables, categorical)
+    return pa.Table.from_pandas(frame, preserve_index=False)
@@ -0,0 +1,140 @@
+"""Precomputed node/link payloads for the D3 graph view
+
+The payload for a result set is built once and kept as JSON and gzip
+bytes with an ETag, so unchanged data is served from memory (or answered
+with 304 Not Modified). Node positions are computed on the server and
+kept stable across updates: a node keeps its layout slot as long as it
+stays in the results, and new nodes take the free slots. Large graphs are
+reduced to their biggest nodes plus one aggregate node per population
+range (level of detail).
+"""
+
+import gzip
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from config import GRAPH_WIDTH, GRAPH_HEIGHT, GRAPH_MAX_NODES, GRAPH_MAX_PAYLOADS
+
+# Golden angle, successive slots of a sunflower (phyllotaxis) spiral
+_GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+_MIN_RADIUS = 4
+_MAX_RADIUS = 30
+
+
+def city_graph(bindings):
+    """Nodes (and links) from ?city ?name ?population bindings"""
+    nodes = []
+    for result in bindings:
+        nodes.append({
+            "id": result["city"]["value"],
+            "name": result["name"]["value"],
+            "population": int(float(result["population"]["value"])),
+        })
+    return nodes, []
+
+
+def _band(population):
+    """Population range (power of ten) used to group aggregated nodes"""
+    return int(math.log10(population)) if population > 0 else 0
+
+
+def reduce_detail(nodes, links, max_nodes=GRAPH_MAX_NODES):
+    """Keep the max_nodes biggest nodes and merge the others by population range"""
+    if max_nodes is None or len(nodes) <= max_nodes:
+        return nodes, links
+    ranked = sorted(nodes, key=lambda n: n["population"], reverse=True)
+    # Make room for the aggregate nodes so the total stays within max_nodes
+    keep = max_nodes
+    while keep > 0 and keep + len({_band(n["population"]) for n in ranked[keep:]}) > max_nodes:
+        keep -= 1
+    kept = ranked[:keep]
+    owner = {node["id"]: node["id"] for node in kept}
+    bands = {}
+    for node in ranked[keep:]:
+        bands.setdefault(_band(node["population"]), []).append(node)
+    clusters = []
+    for band, members in sorted(bands.items(), reverse=True):
+        cluster_id = f"cluster:{band}"
+        for member in members:
+            owner[member["id"]] = cluster_id
+        clusters.append({
+            "id": cluster_id,
+            "name": f"{len(members)} villes ({10 ** band:,}-{10 ** (band + 1):,} hab.)",
+            "population": sum(m["population"] for m in members),
+            "count": len(members),
+            "cluster": True,
+        })
+    merged = {}
+    for link in links:
+        source, target = owner[link["source"]], owner[link["target"]]
+        if source != target:
+            merged[(source, target)] = merged.get((source, target), 0) + link.get("weight", 1)
+    links = [{"source": s, "target": t, "weight": w} for (s, t), w in merged.items()]
+    return kept + clusters, links
+
+
+class GraphPayloads:
+    """Cache of rendered graph payloads, one per name and level of detail"""
+
+    def __init__(self, width=GRAPH_WIDTH, height=GRAPH_HEIGHT, max_entries=GRAPH_MAX_PAYLOADS):
+        self.width = width
+        self.height = height
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _layout(self, name, nodes):
+        """Assign x/y/r to nodes, reusing the slot each node had last time"""
+        present = {node["id"] for node in nodes}
+        slots = {node_id: slot for node_id, slot in self._slots.get(name, {}).items()
+                 if node_id in present}
+        used = set(slots.values())
+        free = (slot for slot in range(len(nodes) + len(used)) if slot not in used)
+        for node in sorted(nodes, key=lambda n: n["population"], reverse=True):
+            if node["id"] not in slots:
+                slots[node["id"]] = next(free)
+        self._slots[name] = slots
+
+        largest = max((n["population"] for n in nodes), default=1) or 1
+        outer = max(slots.values(), default=0) + 1
+        spacing = (min(self.width, self.height) / 2 - _MAX_RADIUS) / math.sqrt(outer)
+        cx, cy = self.width / 2, self.height / 2
+        for node in nodes:
+            slot = slots[node["id"]]
+            distance = spacing * math.sqrt(slot + 0.5)
+            angle = slot * _GOLDEN_ANGLE
+            node["x"] = round(cx + distance * math.cos(angle), 1)
+            node["y"] = round(cy + distance * math.sin(angle), 1)
+            size = math.sqrt(node["population"] / largest)
+            node["r"] = round(_MIN_RADIUS + (_MAX_RADIUS - _MIN_RADIUS) * size, 1)
+
+    def get(self, name, bindings, build=city_graph, max_nodes=GRAPH_MAX_NODES):
+        """Return (etag, json_bytes, gzip_bytes), rebuilt only when bindings change"""
+        digest = hashlib.sha256(
+            json.dumps(bindings, sort_keys=True).encode('utf-8')).hexdigest()
+        key = (name, max_nodes)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == digest:
+                self._entries.move_to_end(key)
+                return entry[1:]
+            nodes, links = reduce_detail(*build(bindings), max_nodes=max_nodes)
+            self._layout(key, nodes)
+            body = json.dumps({
+                "nodes": nodes,
+                "links": links,
+                "width": self.width,
+                "height": self.height,
+            }, ensure_ascii=False).encode('utf-8')
+            etag = hashlib.sha256(body).hexdigest()[:32]
+            entry = (digest, etag, body, gzip.compress(body, compresslevel=6))
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._slots.pop(evicted, None)
+            return entry[1:]
@@ -0,0 +1,283 @@
+"""Materialized RDFS (and selected OWL RL) inference for local graphs
+
+The Reasoner computes every triple entailed by a graph under the rules
+below and keeps them in a separate `inferred` graph, so queries needing
+reasoning become plain lookups on graph + inferred instead of property
+paths like rdfs:subClassOf*.
+
+    RDFS    rdfs2 domain, rdfs3 range, rdfs5/rdfs7 subPropertyOf,
+            rdfs9/rdfs11 subClassOf
+    OWL RL  equivalentClass, equivalentProperty, inverseOf,
+            SymmetricProperty, TransitiveProperty
+
+Evaluation is semi-naive: each new triple is joined once with the known
+triples instead of re-running every rule over the whole graph. Adding
+triples only propagates the new ones; removing triples uses DRed
+(over-delete what depended on them, then re-derive what still holds).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+
+from rdflib import Graph, Literal
+from rdflib.namespace import RDF, RDFS, OWL
+
+TYPE = RDF.type
+SUBCLASS = RDFS.subClassOf
+SUBPROPERTY = RDFS.subPropertyOf
+DOMAIN = RDFS.domain
+RANGE = RDFS.range
+INVERSE = OWL.inverseOf
+EQUIVALENT_CLASS = OWL.equivalentClass
+EQUIVALENT_PROPERTY = OWL.equivalentProperty
+SYMMETRIC = OWL.SymmetricProperty
+TRANSITIVE = OWL.TransitiveProperty
+
+# Schema triples assumed by every graph, so classes only used in
+# subClassOf statements or declared as owl:Class are also rdfs:Class
+AXIOMS = (
+    (SUBCLASS, DOMAIN, RDFS.Class),
+    (SUBCLASS, RANGE, RDFS.Class),
+    (OWL.Class, SUBCLASS, RDFS.Class),
+)
+
+_CACHE_SIZE = 8
+
+
+class Reasoner:
+    def __init__(self, graph):
+        self.graph = graph
+        self.inferred = Graph()
+        self.explicit = set()
+        self.facts = set()
+        # Index by (predicate, subject) -> objects and (predicate, object) -> subjects
+        self._ps = defaultdict(set)
+        self._po = defaultdict(set)
+        self._pairs = defaultdict(set)
+        self._assert(AXIOMS)
+        self._assert(graph)
+
+    def _index(self, triple):
+        s, p, o = triple
+        self.facts.add(triple)
+        self._ps[(p, s)].add(o)
+        self._po[(p, o)].add(s)
+        self._pairs[p].add((s, o))
+
+    def _unindex(self, triple):
+        s, p, o = triple
+        self.facts.discard(triple)
+        self._ps[(p, s)].discard(o)
+        self._po[(p, o)].discard(s)
+        self._pairs[p].discard((s, o))
+
+    def objects(self, subject, predicate):
+        return self._ps.get((predicate, subject), ())
+
+    def subjects(self, predicate, object_):
+        return self._po.get((predicate, object_), ())
+
+    def _consequences(self, triple):
+        """Triples derived by one rule application using `triple` as a premise"""
+        s, p, o = triple
+        ps, po, pairs, facts = self._ps, self._po, self._pairs, self.facts
+
+        # Rules where triple is an instance (data) premise
+        for c in ps.get((DOMAIN, p), ()):
+            yield s, TYPE, c
+        if not isinstance(o, Literal):
+            for c in ps.get((RANGE, p), ()):
+                yield o, TYPE, c
+            for q in ps.get((INVERSE, p), ()):
+                yield o, q, s
+            for q in po.get((INVERSE, p), ()):
+                yield o, q, s
+            if (p, TYPE, SYMMETRIC) in facts:
+                yield o, p, s
+        for q in ps.get((SUBPROPERTY, p), ()):
+            yield s, q, o
+        if (p, TYPE, TRANSITIVE) in facts:
+            for z in ps.get((p, o), ()):
+                yield s, p, z
+            for w in po.get((p, s), ()):
+                yield w, p, o
+
+        # Rules where triple is a schema premise
+        if p == TYPE:
+            for d in ps.get((SUBCLASS, o), ()):
+                yield s, TYPE, d
+            if o == SYMMETRIC:
+                for x, y in pairs.get(s, ()):
+                    if not isinstance(y, Literal):
+                        yield y, s, x
+            elif o == TRANSITIVE:
+                for x, y in pairs.get(s, ()):
+                    for z in ps.get((s, y), ()):
+                        yield x, s, z
+        elif p == SUBCLASS:
+            for x in po.get((TYPE, s), ()):
+                yield x, TYPE, o
+            for d in ps.get((SUBCLASS, o), ()):
+                yield s, SUBCLASS, d
+            for b in po.get((SUBCLASS, s), ()):
+                yield b, SUBCLASS, o
+        elif p == SUBPROPERTY:
+            for x, y in pairs.get(s, ()):
+                yield x, o, y
+            for r in ps.get((SUBPROPERTY, o), ()):
+                yield s, SUBPROPERTY, r
+            for q in po.get((SUBPROPERTY, s), ()):
+                yield q, SUBPROPERTY, o
+        elif p == DOMAIN:
+            for x, _ in pairs.get(s, ()):
+                yield x, TYPE, o
+        elif p == RANGE:
+            for _, y in pairs.get(s, ()):
+                if not isinstance(y, Literal):
+                    yield y, TYPE, o
+        elif p == INVERSE:
+            for x, y in pairs.get(s, ()):
+                if not isinstance(y, Literal):
+                    yield y, o, x
+            for x, y in pairs.get(o, ()):
+                if not isinstance(y, Literal):
+                    yield y, s, x
+        elif p == EQUIVALENT_CLASS:
+            yield s, SUBCLASS, o
+            yield o, SUBCLASS, s
+        elif p == EQUIVALENT_PROPERTY:
+            yield s, SUBPROPERTY, o
+            yield o, SUBPROPERTY, s
+
+    def _derivable(self, triple):
+        """Whether one rule derives triple from the current facts"""
+        s, p, o = triple
+        ps, po, facts = self._ps, self._po, self.facts
+        if any((s, q, o) in facts for q in po.get((SUBPROPERTY, p), ())):
+            return True
+        if not isinstance(o, Literal):
+            if any((o, q, s) in facts for q in ps.get((INVERSE, p), ())):
+                return True
+            if any((o, q, s) in facts for q in po.get((INVERSE, p), ())):
+                return True
+            if (p, TYPE, SYMMETRIC) in facts and (o, p, s) in facts:
+                return True
+        if (p, TYPE, TRANSITIVE) in facts and any(
+                (m, p, o) in facts for m in ps.get((p, s), ()) if m != o):
+            return True
+        if p == TYPE:
+            if any(ps.get((q, s)) for q in po.get((DOMAIN, o), ())):
+                return True
+            if any(po.get((q, s)) for q in po.get((RANGE, o), ())):
+                return True
+            if any((s, TYPE, c) in facts for c in po.get((SUBCLASS, o), ())):
+                return True
+        elif p in (SUBCLASS, SUBPROPERTY):
+            equivalent = EQUIVALENT_CLASS if p == SUBCLASS else EQUIVALENT_PROPERTY
+            if (s, equivalent, o) in facts or (o, equivalent, s) in facts:
+                return True
+            if any((m, p, o) in facts for m in ps.get((p, s), ()) if m != o):
+                return True
+        return False
+
+    def _assert(self, triples):
+        """Add explicit triples and everything they entail"""
+        queue = []
+        for triple in triples:
+            self.explicit.add(triple)
+            if triple in self.facts:
+                # Was inferred, is now explicit as well
+                self.inferred.remove(triple)
+                continue
+            self._index(triple)
+            queue.append(triple)
+        self._propagate(queue)
+
+    def _propagate(self, queue):
+        while queue:
+            triple = queue.pop()
+            # Collected first, indexing while the rules iterate the indexes is unsafe
+            for derived in list(self._consequences(triple)):
+                if derived not in self.facts:
+                    self._index(derived)
+                    self.inferred.add(derived)
+                    queue.append(derived)
+
+    def add(self, triples):
+        """Add triples to the graph and update the inferred triples"""
+        triples = list(triples)
+        for triple in triples:
+            self.graph.add(triple)
+        self._assert(triples)
+
+    def remove(self, triples):
+        """Remove triples from the graph and retract what no longer follows"""
+        removed = [t for t in triples if t in self.explicit and t not in AXIOMS]
+        for triple in removed:
+            self.graph.remove(triple)
+            self.explicit.discard(triple)
+
+        # Over-delete: every inferred triple with a derivation through a removed one
+        deleted = set(removed)
+        queue = list(removed)
+        while queue:
+            for derived in list(self._consequences(queue.pop())):
+                if derived in self.facts and derived not in self.explicit and derived not in deleted:
+                    deleted.add(derived)
+                    queue.append(derived)
+        for triple in deleted:
+            self._unindex(triple)
+            self.inferred.remove(triple)
+
+        # Re-derive: removed triples may still follow from what is left
+        queue = []
+        for triple in deleted:
+            if triple not in self.explicit and self._derivable(triple):
+                self._index(triple)
+                self.inferred.add(triple)
+                queue.append(triple)
+        self._propagate(queue)
+
+    def closure(self):
+        """Graph with the explicit and inferred triples together"""
+        closure = Graph()
+        for prefix, namespace in self.graph.namespaces():
+            closure.bind(prefix, namespace)
+        for triple in self.graph:
+            closure.add(triple)
+        for triple in self.inferred:
+            closure.add(triple)
+        return closure
+
+
+def graph_hash(graph):
+    """Order-independent content hash of a graph's triples"""
+    total = 0
+    for s, p, o in graph:
+        digest = hashlib.sha256(f"{s.n3()} {p.n3()} {o.n3()}".encode('utf-8')).digest()
+        total = (total + int.from_bytes(digest, 'big')) % (1 << 256)
+    return f"{total:064x}"
+
+
+# Keyed by content and graph object: a reasoner's add()/remove() change its
+# own graph, so it is never handed out for another graph with equal triples.
+# Cached reasoners keep their graph alive, so its id() is not reused.
+_reasoners = OrderedDict()
+_reasoners_lock = threading.Lock()
+
+
+def materialize(graph, key=None):
+    """Reasoner for graph, reused when called again for the same graph and content
+
+    key (e.g. a file checksum) avoids hashing the graph's triples.
+    """
+    key = (key or graph_hash(graph), id(graph))
+    with _reasoners_lock:
+        reasoner = _reasoners.get(key)
+        if reasoner is None or reasoner.graph is not graph:
+            reasoner = _reasoners[key] = Reasoner(graph)
+            while len(_reasoners) > _CACHE_SIZE:
+                _reasoners.popitem(last=False)
+        _reasoners.move_to_end(key)
+        return reasoner
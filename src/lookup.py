@@ -0,0 +1,65 @@
+"""Batched property lookups for known entities
+
+Instead of one query per URI, the URIs are split into batches and each
+batch is sent as a single query with a VALUES block:
+
+    SELECT ?s ?p ?o WHERE { VALUES ?s { <a> <b> ... } VALUES ?p { ... } ?s ?p ?o }
+
+Batches can be run in parallel and their rows are merged back by subject.
+Each query is capped at page_size rows: a batch whose page comes back
+full is split in two and re-sent, and a single URI with more rows than
+that is paged with LIMIT/OFFSET.
+"""
+
+from rdflib import URIRef
+
+from config import LOOKUP_BATCH_SIZE, LOOKUP_WORKERS, LOOKUP_PAGE_SIZE
+from query_templates import to_term
+from rdf_utils import nt_term
+
+
+def _values(variable, uris):
+    return "VALUES ?%s { %s }" % (variable, ' '.join(nt_term(to_term(uri, URIRef)) for uri in uris))
+
+
+def values_query(uris, predicates=None, limit=None):
+    """SELECT ?s ?p ?o for the given subjects, restricted to predicates if given"""
+    clauses = [_values('s', uris)]
+    if predicates:
+        clauses.append(_values('p', predicates))
+    query = "SELECT ?s ?p ?o WHERE { %s ?s ?p ?o }" % ' '.join(clauses)
+    return f"{query} LIMIT {limit}" if limit else query
+
+
+def fetch_properties(client, uris, predicates=None, batch_size=LOOKUP_BATCH_SIZE,
+                     max_workers=LOOKUP_WORKERS, page_size=LOOKUP_PAGE_SIZE):
+    """Return {uri: {predicate: [value, ...]}} for every uri, or None on error
+
+    Values are JSON result terms. URIs without any matching triple map to
+    an empty dict. With max_workers > 1 the batches are sent in parallel.
+    """
+    uris = list(dict.fromkeys(str(uri) for uri in uris))
+    predicates = [str(p) for p in predicates] if predicates else None
+    batches = [uris[i:i + batch_size] for i in range(0, len(uris), batch_size)]
+
+    properties = {uri: {} for uri in uris}
+    while batches:
+        queries = [values_query(batch, predicates, page_size) for batch in batches]
+        pages = client.query_parallel(queries, max_workers)
+        truncated = []
+        for batch, page in zip(batches, pages):
+            if page is None:
+                print(f"Lookup failed for a batch of {len(batch)} URIs starting with {batch[0]}")
+                return None
+            if len(page) >= page_size:
+                # Possibly truncated, retry with smaller batches
+                if len(batch) > 1:
+                    middle = len(batch) // 2
+                    truncated += [batch[:middle], batch[middle:]]
+                    continue
+                page = list(client.query_all(values_query(batch, predicates), page_size))
+            for row in page:
+                values = properties.setdefault(row['s']['value'], {})
+                values.setdefault(row['p']['value'], []).append(row['o'])
+        batches = truncated
+    return properties
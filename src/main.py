@@ -1,41 +1,54 @@
-from sparql_client import DBPediaClient
-from wikidata_client import WikidataClient
+import pandas as pd
+
+from async_client import AsyncDBPediaClient, AsyncWikidataClient, run_queries
 from rdf_utils import create_graph, add_triple, save_graph
-from query_examples2 import QUERIES
+from frames import bindings_to_frame
+from mirror import default_mirror
+from query_examples import QUERIES
+from query_examples2 import QUERIES as WIKIDATA_QUERIES
+
+def format_dates(column):
+    """Dates as YYYY-MM-DD strings, NaT for missing values"""
+    # frames falls back to a string column when dates are mixed with other literals
+    if pd.api.types.is_datetime64_any_dtype(column):
+        column = column.dt.strftime('%Y-%m-%d')
+    return column.astype(object).where(column.notna(), 'NaT')
 
 def main():
-    # Initialize clients
-    dbpedia_client = DBPediaClient()
-    wikidata_client = WikidataClient()
+    # Initialize clients, the example queries are answered from the local
+    # mirror once it has been synced (python mirror.py)
+    mirror = default_mirror()
+    dbpedia_client = AsyncDBPediaClient(mirror=mirror)
+    wikidata_client = AsyncWikidataClient(mirror=mirror)
+
+    # The three remote queries are independent, so they run concurrently
+    print("Querying DBpedia and Wikidata...")
+    cities, writers, painters = run_queries([
+        (dbpedia_client, QUERIES['french_cities']),
+        (dbpedia_client, QUERIES['french_writers']),
+        (wikidata_client, WIKIDATA_QUERIES['wikidata_french_painters']),
+    ])
 
-    # Example 1: Query French cities from DBpedia
-    print("Querying French cities from DBpedia...")
-    results = dbpedia_client.query(QUERIES['french_cities'])
-    if results:
+    # Example 1: French cities from DBpedia
+    if cities:
+        frame = bindings_to_frame(cities)
         print("\nTop 10 French cities by population:")
-        for result in results:
-            name = result['name']['value']
-            population = result['population']['value']
+        for name, population in zip(frame['name'], frame['population']):
             print(f"{name}: {population} habitants")
+        print(f"Total : {frame['population'].sum()} habitants")
     
-    # Example 2: Query French writers from DBpedia
-    print("\nQuerying French writers from DBpedia...")
-    results = dbpedia_client.query(QUERIES['french_writers'])
-    if results:
+    # Example 2: French writers from DBpedia
+    if writers:
+        frame = bindings_to_frame(writers)
         print("\nFrench writers:")
-        for result in results:
-            name = result['name']['value']
-            birth = result['birth']['value']
+        for name, birth in zip(frame['name'], format_dates(frame['birth'])):
             print(f"{name} (né(e) le {birth})")
     
-    # Example 3: Query French painters from Wikidata
-    print("\nQuerying French painters from Wikidata...")
-    results = wikidata_client.query(QUERIES['wikidata_french_painters'])
-    if results:
+    # Example 3: French painters from Wikidata
+    if painters:
+        frame = bindings_to_frame(painters)
         print("\nFrench painters:")
-        for result in results:
-            name = result['painterLabel']['value']
-            birth = result['birthDate']['value']
+        for name, birth in zip(frame['painterLabel'], format_dates(frame['birthDate'])):
             print(f"{name} (né(e) le {birth})")
     
     # Example 4: Creating and saving a local RDF graph
@@ -0,0 +1,242 @@
+"""Local mirror of remote SPARQL data
+
+Registered CONSTRUCT queries are run against their endpoint on a
+schedule and their results kept in a local graph (one named graph per
+source, saved as N-Triples through rdf_utils). SELECT queries and query
+templates routed to a source that has been synced are then answered
+in-process instead of over the network.
+
+Routes are keyed by endpoint without its scheme, so http:// and https://
+URLs of the same endpoint share them. CONSTRUCT results are fetched in
+ordered pages, and a page cut short by the endpoint's row cap fails the
+sync rather than leaving a partial copy. Syncing only happens when asked
+for, with sync()/sync_due(), start() or `python mirror.py`.
+"""
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from rdflib import ConjunctiveGraph, Graph, URIRef
+
+from config import (DBPEDIA_ENDPOINT, WIKIDATA_ENDPOINT, DBPEDIA_MAX_ROWS, MIRROR_DIR,
+                    MIRROR_INTERVAL, MIRROR_CHECK_INTERVAL, MIRROR_PAGE_SIZE)
+from cache import normalize_query
+from rdf_utils import bulk_add, bulk_load, stream_save, json_term, prepare_query
+from pagination import ensure_order
+from search_index import SearchIndex
+from query_optimizer import optimize
+from query_templates import registry, to_term
+from transport import sparql_request
+from query_examples import QUERIES, MIRRORS
+from query_examples2 import QUERIES as WIKIDATA_QUERIES, MIRRORS as WIKIDATA_MIRRORS
+
+MIRROR_NAMESPACE = "urn:mirror:"
+
+
+def endpoint_key(endpoint):
+    """Endpoint URL without scheme or trailing slash, e.g. dbpedia.org/sparql"""
+    parts = urlsplit(endpoint)
+    return parts.netloc.lower() + parts.path.rstrip('/')
+
+
+def _json_results(results, full_results):
+    bindings = [
+        {str(var): json_term(row[var]) for var in results.vars if row[var] is not None}
+        for row in results
+    ]
+    if full_results:
+        return {"head": {"vars": [str(var) for var in results.vars]},
+                "results": {"bindings": bindings}}
+    return bindings
+
+
+class Mirror:
+    def __init__(self, directory=MIRROR_DIR, page_size=MIRROR_PAGE_SIZE, max_rows=DBPEDIA_MAX_ROWS):
+        self.directory = directory
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.graph = ConjunctiveGraph()
+        self.sources = {}
+        self.routes = {}
+        self.template_routes = {}
+        self.last_sync = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        self._search = (None, None)
+        self._contexts = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            try:
+                with open(self._state_path()) as f:
+                    self.last_sync = json.load(f)
+            except (OSError, ValueError):
+                self.last_sync = {}
+
+    def _state_path(self):
+        return os.path.join(self.directory, "state.json")
+
+    def _data_path(self, name):
+        return os.path.join(self.directory, f"{name}.nt")
+
+    def _context(self, name):
+        # Same Graph object each time, so query statistics stay cached for it
+        context = self._contexts.get(name)
+        if context is None:
+            context = self._contexts[name] = self.graph.get_context(URIRef(MIRROR_NAMESPACE + name))
+        return context
+
+    def register(self, name, endpoint, construct_query, selects=(), templates=None,
+                 interval=MIRROR_INTERVAL):
+        """Mirror the result of construct_query and answer selects from it
+
+        selects are query strings, or (remote, local) pairs when the query
+        sent to the endpoint cannot run locally as is. templates maps
+        registered template names to the parameter values the copy covers.
+        Data saved by a previous run is loaded straight away.
+        """
+        with self._lock:
+            self.sources[name] = {
+                'endpoint': endpoint,
+                'construct': construct_query,
+                'interval': interval,
+            }
+            key = endpoint_key(endpoint)
+            for select in selects:
+                remote, local = select if isinstance(select, tuple) else (select, select)
+                self.routes[(key, normalize_query(remote))] = (name, local)
+            for template, fixed in (templates or {}).items():
+                self.template_routes[(key, template)] = (name, fixed)
+            if name in self.last_sync:
+                path = self._data_path(name)
+                if not os.path.exists(path) or bulk_load(self._context(name), path) is None:
+                    del self.last_sync[name]
+
+    def _fetch(self, name):
+        """Whole CONSTRUCT result of a source, fetched page by page, or None"""
+        source = self.sources[name]
+        construct = ensure_order(source['construct'].strip())
+        fetched = Graph()
+        offset = 0
+        while True:
+            query = f"{construct}\nLIMIT {self.page_size}\nOFFSET {offset}"
+            response = sparql_request(source['endpoint'], query, "application/n-triples")
+            if response.status_code != 200:
+                print(f"Error {response.status_code} syncing {name}: {response.text}")
+                return None
+            page = Graph()
+            page.parse(data=response.text, format='nt')
+            if self.max_rows and len(page) >= self.max_rows:
+                print(f"Error syncing {name}: page at offset {offset} hit the "
+                      f"{self.max_rows} row cap, keeping the previous copy")
+                return None
+            if not len(page):
+                return fetched
+            bulk_add(fetched, page)
+            offset += self.page_size
+
+    def sync(self, name):
+        """Fetch the source's CONSTRUCT result and replace its local copy"""
+        try:
+            fetched = self._fetch(name)
+        except Exception as e:
+            print(f"Error syncing {name}: {e}")
+            return False
+        if fetched is None:
+            return False
+        with self._lock:
+            context = self._context(name)
+            context.remove((None, None, None))
+            bulk_add(context, fetched)
+            self.last_sync[name] = time.time()
+            if self.directory:
+                stream_save(context, self._data_path(name))
+                with open(self._state_path(), 'w') as f:
+                    json.dump(self.last_sync, f)
+        return True
+
+    def sync_due(self):
+        """Sync every source whose interval has elapsed since its last sync"""
+        now = time.time()
+        for name, source in list(self.sources.items()):
+            if now - self.last_sync.get(name, 0) >= source['interval']:
+                self.sync(name)
+
+    def start(self, check_interval=MIRROR_CHECK_INTERVAL):
+        """Sync due sources in the background now and then every check_interval seconds"""
+        def run(delay):
+            self._timer = threading.Timer(delay, sync)
+            self._timer.daemon = True
+            self._timer.start()
+        def sync():
+            self.sync_due()
+            run(check_interval)
+        run(0)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def answer(self, endpoint, query_string, full_results=False):
+        """Return JSON bindings for a routed SELECT from the local copy, or None
+
+        With full_results the whole JSON results document is returned.
+        """
+        route = self.routes.get((endpoint_key(endpoint), normalize_query(query_string)))
+        if route is None or route[0] not in self.last_sync:
+            return None
+        name, local = route
+        with self._lock:
+            context = self._context(name)
+            results = context.query(optimize(prepare_query(local, context.namespaces()), context))
+            return _json_results(results, full_results)
+
+    def answer_template(self, endpoint, template_name, values, full_results=False):
+        """Like answer() for a registered query template and its parameter values
+
+        Returns None unless the values match the ones the copy was made for.
+        """
+        route = self.template_routes.get((endpoint_key(endpoint), template_name))
+        if route is None or route[0] not in self.last_sync:
+            return None
+        name, fixed = route
+        template = registry.get(template_name)
+        terms = template.terms(values)
+        if any(terms[param] != to_term(value, template.params[param])
+               for param, value in fixed.items()):
+            return None
+        with self._lock:
+            return _json_results(template.query(self._context(name), **values), full_results)
+
+    def search_index(self):
+        """Label search index over the mirrored data, rebuilt after each sync"""
+        with self._lock:
+            version, index = self._search
+            if index is None or version != self.last_sync:
+                index = SearchIndex(self.graph)
+                self._search = (dict(self.last_sync), index)
+            return index
+
+
+def default_mirror():
+    """Mirror of the example queries from query_examples and query_examples2"""
+    mirror = Mirror()
+    for name, spec in MIRRORS.items():
+        mirror.register(name, DBPEDIA_ENDPOINT, spec['construct'],
+                        [QUERIES[select] for select in spec['selects']], spec.get('templates'))
+    for name, spec in WIKIDATA_MIRRORS.items():
+        # Remote queries use the label service, the copy answers local equivalents
+        mirror.register(name, WIKIDATA_ENDPOINT, spec['construct'],
+                        [(WIKIDATA_QUERIES[select], local) for select, local in spec['selects'].items()])
+    return mirror
+
+
+if __name__ == "__main__":
+    # Sync every mirrored source now, e.g. from cron
+    mirror = default_mirror()
+    for name in mirror.sources:
+        if mirror.sync(name):
+            print(f"Synced {name}: {len(mirror._context(name))} triples")
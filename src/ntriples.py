@@ -0,0 +1,18 @@
+"""N-Triples string escapes, shared by the graph loader and the result parsers"""
+
+import re
+
+_ESCAPE_RE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+_ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f'}
+
+
+def unescape_nt(text):
+    """Decode N-Triples string escapes (\\n, \\uXXXX, ...)"""
+    if '\\' not in text:
+        return text
+    def replace(match):
+        code = match.group(1)
+        if code[0] in 'uU' and len(code) > 1:
+            return chr(int(code[1:], 16))
+        return _ESCAPES.get(code, code)
+    return _ESCAPE_RE.sub(replace, text)
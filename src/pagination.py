@@ -0,0 +1,152 @@
+"""Automatic pagination of SPARQL SELECT queries
+
+A query is rewritten into ordered pages, either with LIMIT/OFFSET or,
+when a unique sortable key variable is given, with keyset pagination
+(FILTER(?key > last) ORDER BY ?key) which stays fast on deep pages.
+The next page is fetched in the background while the current one is
+being consumed, and all pages are exposed as a single lazy iterator.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+_LIMIT_RE = re.compile(r'\bLIMIT\s+(\d+)\s*$', re.I)
+_OFFSET_RE = re.compile(r'\bOFFSET\s+(\d+)\s*$', re.I)
+_ORDER_BY_RE = re.compile(r'\bORDER\s+BY\b[^{}]*$', re.I)
+_SELECT_RE = re.compile(r'\bSELECT\s+(?:DISTINCT\s+|REDUCED\s+)?(.*?)\s*(?:\bWHERE\b|\{)', re.I | re.S)
+_VAR_RE = re.compile(r'[?$]([A-Za-z_][A-Za-z0-9_]*)')
+
+
+def split_modifiers(query):
+    """Return (query, limit, offset) with trailing LIMIT/OFFSET removed"""
+    query = query.strip()
+    limit = offset = None
+    for _ in range(2):
+        match = _LIMIT_RE.search(query)
+        if match and limit is None:
+            limit = int(match.group(1))
+            query = query[:match.start()].rstrip()
+            continue
+        match = _OFFSET_RE.search(query)
+        if match and offset is None:
+            offset = int(match.group(1))
+            query = query[:match.start()].rstrip()
+    return query, limit, offset
+
+
+def projected_variables(query):
+    """Variables of the SELECT clause (or of the whole query for SELECT *)"""
+    match = _SELECT_RE.search(query)
+    clause = match.group(1) if match else ''
+    if clause.strip() == '*' or not match:
+        clause = query
+    # "(expr AS ?v)" projects ?v only, innermost parentheses go first
+    inner = re.compile(r'\(([^()]*)\)')
+    while inner.search(clause):
+        clause = inner.sub(lambda m: ' '.join(re.findall(r'\bAS\s+([?$]\w+)', m.group(1), re.I)), clause)
+    seen = []
+    for var in _VAR_RE.findall(clause):
+        if var not in seen:
+            seen.append(var)
+    return seen
+
+
+def ensure_order(query):
+    """Order by the projected variables so pages are stable
+
+    An existing ORDER BY is kept, with the projected variables it does not
+    mention appended as tie-breakers (ORDER BY ?birth alone has ties).
+    """
+    variables = projected_variables(query)
+    match = _ORDER_BY_RE.search(query)
+    if match is None:
+        if not variables:
+            return query
+        return f"{query}\nORDER BY " + ' '.join(f"?{v}" for v in variables)
+    ordered = set(_VAR_RE.findall(match.group(0)))
+    extra = [f"?{v}" for v in variables if v not in ordered]
+    return f"{query} {' '.join(extra)}" if extra else query
+
+
+def format_term(term):
+    """Format a JSON result term as SPARQL syntax"""
+    value = term['value']
+    if term['type'] == 'uri':
+        return f"<{value}>"
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+    if 'xml:lang' in term:
+        return f'"{escaped}"@{term["xml:lang"]}'
+    if 'datatype' in term:
+        return f'"{escaped}"^^<{term["datatype"]}>'
+    return f'"{escaped}"'
+
+
+def keyset_query(query, key, after=None):
+    """Rewrite query to return rows with ?key greater than after, ordered by ?key
+
+    IRIs cannot be compared with >, so IRI keys are compared and ordered
+    by their string value.
+    """
+    query = _ORDER_BY_RE.sub('', query).rstrip()
+    order = f"?{key}"
+    if after is not None:
+        bound = format_term(after)
+        if after['type'] == 'uri':
+            order = f"STR(?{key})"
+            bound = format_term({'type': 'literal', 'value': after['value']})
+        end = query.rindex('}')
+        query = f"{query[:end]}  FILTER({order} > {bound})\n{query[end:]}"
+    return f"{query}\nORDER BY {order}"
+
+
+def paginate(client, query, page_size=1000, key=None, prefetch=True, max_rows=None):
+    """Lazily iterate over every result row of a SELECT query
+
+    An existing LIMIT/OFFSET is kept as the overall bound. key names a
+    variable with unique, sortable values to switch to keyset pagination.
+    """
+    base, limit, offset = split_modifiers(query)
+    if limit is not None:
+        max_rows = limit if max_rows is None else min(limit, max_rows)
+    offset = offset or 0
+    key = key.lstrip('?$') if key else None
+    if key is None:
+        base = ensure_order(base)
+
+    def fetch(offset, after):
+        if key is None:
+            text = f"{base}\nLIMIT {page_size}\nOFFSET {offset}"
+        else:
+            text = f"{keyset_query(base, key, after)}\nLIMIT {page_size}"
+            if offset:
+                text += f"\nOFFSET {offset}"
+        return client.query(text)
+
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        returned = 0
+        page = fetch(offset, None)
+        while page:
+            next_args = None
+            if len(page) >= page_size and (max_rows is None or returned + len(page) < max_rows):
+                # Keyset pages restart from the last key rather than an offset
+                after = page[-1].get(key) if key else None
+                if key is not None and after is None:
+                    print(f"Key variable ?{key} is unbound, stopping pagination")
+                else:
+                    offset = offset + page_size if key is None else 0
+                    next_args = (offset, after)
+            future = executor.submit(fetch, *next_args) if executor and next_args else None
+            for row in page:
+                if max_rows is not None and returned >= max_rows:
+                    return
+                returned += 1
+                yield row
+            if next_args is None:
+                return
+            page = future.result() if future else fetch(*next_args)
+        if page is None:
+            print("Error fetching page, stopping pagination")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,5 +1,7 @@
 """Example SPARQL queries for DBPedia"""
 
+from rdflib import URIRef
+
 QUERIES = {
     'french_cities': """
         PREFIX dbo: <http://dbpedia.org/ontology/>
@@ -31,4 +33,100 @@ QUERIES = {
         ORDER BY ?birth
         LIMIT 10
     """
-}
\ No newline at end of file
+}
+
+# CONSTRUCT queries copied into the local mirror (see mirror.py), with the
+# SELECT queries from QUERIES and the TEMPLATES (for the given parameter
+# values) that can be answered from each copy
+MIRRORS = {
+    'french_cities': {
+        'construct': """
+            PREFIX dbo: <http://dbpedia.org/ontology/>
+
+            CONSTRUCT {
+                ?city a dbo:City ;
+                      dbo:country <http://dbpedia.org/resource/France> ;
+                      rdfs:label ?name ;
+                      dbo:populationTotal ?population .
+            }
+            WHERE {
+                ?city a dbo:City ;
+                      dbo:country <http://dbpedia.org/resource/France> ;
+                      rdfs:label ?name ;
+                      dbo:populationTotal ?population .
+                FILTER(LANG(?name) = "fr")
+            }
+        """,
+        'selects': ['french_cities'],
+        'templates': {
+            'cities_by_country': {'country': "http://dbpedia.org/resource/France", 'lang': "fr"},
+        },
+    },
+
+    'french_writers': {
+        'construct': """
+            PREFIX dbo: <http://dbpedia.org/ontology/>
+
+            CONSTRUCT {
+                ?writer a dbo:Writer ;
+                        dbo:birthPlace ?place ;
+                        rdfs:label ?name ;
+                        dbo:birthDate ?birth .
+                ?place dbo:country <http://dbpedia.org/resource/France> .
+            }
+            WHERE {
+                ?writer a dbo:Writer ;
+                        dbo:birthPlace ?place ;
+                        rdfs:label ?name ;
+                        dbo:birthDate ?birth .
+                ?place dbo:country <http://dbpedia.org/resource/France> .
+                FILTER(LANG(?name) = "fr")
+            }
+        """,
+        'selects': ['french_writers'],
+        'templates': {
+            'writers_by_country': {'country': "http://dbpedia.org/resource/France", 'lang': "fr"},
+        },
+    },
+}
+
+
+# Parameterized versions of the examples (see query_templates.py),
+# $name parameters are declared with their type
+TEMPLATES = {
+    'cities_by_country': {
+        'query': """
+            PREFIX dbo: <http://dbpedia.org/ontology/>
+
+            SELECT DISTINCT ?city ?name ?population
+            WHERE {
+                ?city a dbo:City ;
+                      dbo:country $country ;
+                      rdfs:label ?name ;
+                      dbo:populationTotal ?population .
+                FILTER(LANG(?name) = $lang)
+            }
+            ORDER BY DESC(?population)
+            LIMIT $limit
+        """,
+        'params': {'country': URIRef, 'lang': str, 'limit': int},
+    },
+
+    'writers_by_country': {
+        'query': """
+            PREFIX dbo: <http://dbpedia.org/ontology/>
+
+            SELECT DISTINCT ?writer ?name ?birth
+            WHERE {
+                ?writer a dbo:Writer ;
+                        dbo:birthPlace/dbo:country $country ;
+                        rdfs:label ?name ;
+                        dbo:birthDate ?birth .
+                FILTER(LANG(?name) = $lang)
+            }
+            ORDER BY ?birth
+            LIMIT $limit
+        """,
+        'params': {'country': URIRef, 'lang': str, 'limit': int},
+    },
+}
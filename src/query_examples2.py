@@ -32,3 +32,52 @@ QUERIES = {
 """
 
 }
+
+# Wikidata data copied into the local mirror (see mirror.py). The label
+# service only exists on Wikidata, so the copy stores the labels as
+# rdfs:label and the painters query is answered by a local equivalent.
+MIRRORS = {
+    'wikidata_french_painters': {
+        'construct': """
+            PREFIX wd: <http://www.wikidata.org/entity/>
+            PREFIX wdt: <http://www.wikidata.org/prop/direct/>
+            PREFIX wikibase: <http://wikiba.se/ontology#>
+            PREFIX bd: <http://www.bigdata.com/rdf#>
+
+            CONSTRUCT {
+                ?painter wdt:P31 wd:Q5 ;
+                         wdt:P106 wd:Q1028181 ;
+                         wdt:P27 wd:Q142 ;
+                         wdt:P569 ?birthDate ;
+                         rdfs:label ?painterLabel .
+            }
+            WHERE {
+                ?painter wdt:P31 wd:Q5 ;
+                         wdt:P106 wd:Q1028181 ;
+                         wdt:P27 wd:Q142 ;
+                         wdt:P569 ?birthDate .
+                SERVICE wikibase:label {
+                    bd:serviceParam wikibase:language "fr,en" .
+                    ?painter rdfs:label ?painterLabel .
+                }
+            }
+        """,
+        'selects': {
+            'wikidata_french_painters': """
+                PREFIX wd: <http://www.wikidata.org/entity/>
+                PREFIX wdt: <http://www.wikidata.org/prop/direct/>
+
+                SELECT ?painter ?painterLabel ?birthDate
+                WHERE {
+                    ?painter wdt:P31 wd:Q5 ;
+                             wdt:P106 wd:Q1028181 ;
+                             wdt:P27 wd:Q142 ;
+                             wdt:P569 ?birthDate .
+                    OPTIONAL { ?painter rdfs:label ?painterLabel }
+                }
+                ORDER BY ?birthDate
+                LIMIT 10
+            """,
+        },
+    },
+}
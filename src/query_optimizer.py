@@ -0,0 +1,440 @@
+"""Statistics-driven join ordering for SPARQL queries evaluated by rdflib
+
+rdflib evaluates a basic graph pattern (BGP) as nested loops over its
+triple patterns in the written order, only moving patterns with more
+constant terms first. `optimize()` rewrites a prepared query so that
+each BGP runs in the order with the smallest estimated intermediate
+results. The estimates use per-predicate and per-class cardinalities of
+the graph. FILTER conditions are also checked as soon as their
+variables are bound instead of after the whole BGP. `explain()` shows
+the chosen plan.
+
+    prepared = optimize(prepare_query(text, graph.namespaces()), graph)
+    results = graph.query(prepared)
+"""
+
+import threading
+import weakref
+
+from rdflib import BNode, Variable
+from rdflib.namespace import RDF
+from rdflib.plugins.sparql import CUSTOM_EVALS
+from rdflib.plugins.sparql.evalutils import _ebv
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.plugins.sparql.sparql import AlreadyBound, Query
+
+from rdf_utils import prepare_query
+
+# Share of solutions kept by a FILTER condition when statistics say nothing better
+EQUALITY = 0.1
+RANGE = 1 / 3
+TEXT_MATCH = 0.25
+OTHER = 0.5
+TEXT_FUNCTIONS = {'Builtin_REGEX', 'Builtin_CONTAINS', 'Builtin_STRSTARTS', 'Builtin_STRENDS'}
+# Conditions evaluating graph patterns of their own stay where they were written
+UNMOVABLE = {'Builtin_EXISTS', 'Builtin_NOTEXISTS'}
+
+
+def _is_variable(term):
+    return isinstance(term, (Variable, BNode))
+
+
+def _pattern_variables(triple):
+    return {term for term in triple if _is_variable(term)}
+
+
+def _variables(expr):
+    """Variables used by a FILTER expression"""
+    if isinstance(expr, Variable):
+        return {expr}
+    if isinstance(expr, CompValue):
+        return set().union(*(_variables(v) for k, v in expr.items() if not k.startswith('_')))
+    if isinstance(expr, (list, tuple)):
+        return set().union(*(_variables(v) for v in expr))
+    return set()
+
+
+def _names(expr):
+    """Names of every node of a FILTER expression"""
+    if isinstance(expr, CompValue):
+        return {expr.name}.union(*(_names(v) for k, v in expr.items() if not k.startswith('_')))
+    if isinstance(expr, (list, tuple)):
+        return set().union(*(_names(v) for v in expr))
+    return set()
+
+
+def _conjuncts(expr):
+    if isinstance(expr, CompValue) and expr.name == 'ConditionalAndExpression':
+        return [c for e in [expr.expr] + list(expr.other or []) for c in _conjuncts(e)]
+    return [expr]
+
+
+class Statistics:
+    """Cardinalities of a graph, counted per predicate and per class on first use
+
+    refresh() drops the counts if the number of triples in the graph changed.
+    """
+
+    def __init__(self, graph):
+        # Weak, so cached statistics and optimized queries do not keep graphs alive
+        self._graph = weakref.ref(graph)
+        self._size = None
+        self._predicates = {}
+        self._classes = {}
+        self._totals = None
+        self._lock = threading.RLock()
+
+    @property
+    def graph(self):
+        return self._graph()
+
+    def refresh(self):
+        with self._lock:
+            size = len(self.graph)
+            if size != self._size:
+                self._size = size
+                self._predicates = {}
+                self._classes = {}
+                self._totals = None
+
+    def predicate(self, p):
+        """(triples, distinct subjects, distinct objects) of predicate p"""
+        with self._lock:
+            counts = self._predicates.get(p)
+            if counts is None:
+                subjects, objects, count = set(), set(), 0
+                for s, _, o in self.graph.triples((None, p, None)):
+                    subjects.add(s)
+                    objects.add(o)
+                    count += 1
+                counts = self._predicates[p] = (count, len(subjects), len(objects))
+            return counts
+
+    def instances(self, c):
+        """Number of subjects typed with class c"""
+        with self._lock:
+            count = self._classes.get(c)
+            if count is None:
+                count = self._classes[c] = sum(1 for _ in self.graph.triples((None, RDF.type, c)))
+            return count
+
+    def totals(self):
+        """(triples, distinct subjects, distinct predicates, distinct objects)"""
+        with self._lock:
+            if self._totals is None:
+                subjects, predicates, objects = set(), set(), set()
+                for s, p, o in self.graph:
+                    subjects.add(s)
+                    predicates.add(p)
+                    objects.add(o)
+                self._totals = (len(self.graph), len(subjects), len(predicates), len(objects))
+            return self._totals
+
+    def estimate(self, triple, bound=()):
+        """Estimated matches of a triple pattern once the variables in bound have values"""
+        s, p, o = triple
+        s_bound, p_bound, o_bound = (not _is_variable(t) or t in bound for t in triple)
+        if _is_variable(p):
+            count, subjects, predicates, objects = self.totals()
+            if p_bound:
+                count /= max(predicates, 1)
+        elif p == RDF.type and o_bound and not _is_variable(o):
+            count = self.instances(o)
+            subjects = self.predicate(RDF.type)[1]
+            o_bound = False
+        else:
+            count, subjects, objects = self.predicate(p)
+        if s_bound:
+            count /= max(subjects, 1)
+        if o_bound:
+            count /= max(objects, 1)
+        return count
+
+    def selectivity(self, expr, predicates=None):
+        """Estimated share of solutions kept by a FILTER condition
+
+        predicates maps variables to the predicate whose objects they are.
+        """
+        predicates = predicates or {}
+        name = expr.name if isinstance(expr, CompValue) else None
+        if name == 'ConditionalAndExpression':
+            share = 1.0
+            for e in [expr.expr] + list(expr.other or []):
+                share *= self.selectivity(e, predicates)
+            return share
+        if name == 'ConditionalOrExpression':
+            missed = 1.0
+            for e in [expr.expr] + list(expr.other or []):
+                missed *= 1 - self.selectivity(e, predicates)
+            return 1 - missed
+        if name == 'UnaryNot':
+            return 1 - self.selectivity(expr.expr, predicates)
+        if name == 'RelationalExpression':
+            if expr.op in ('=', '!='):
+                share = self._equality(expr.expr, predicates)
+                return share if expr.op == '=' else 1 - share
+            if expr.op in ('IN', 'NOT IN'):
+                share = min(1.0, self._equality(expr.expr, predicates) * len(expr.other))
+                return share if expr.op == 'IN' else 1 - share
+            return RANGE
+        if name in TEXT_FUNCTIONS:
+            return TEXT_MATCH
+        return OTHER
+
+    def _equality(self, term, predicates):
+        # ?x = value keeps one of the distinct objects of the predicate binding ?x
+        p = predicates.get(term) if isinstance(term, Variable) else None
+        if p is not None:
+            objects = self.predicate(p)[2]
+            if objects:
+                return 1 / objects
+        return EQUALITY
+
+
+_statistics = weakref.WeakKeyDictionary()
+_statistics_lock = threading.Lock()
+
+
+def statistics(graph):
+    """Statistics of graph, shared by every query optimized for it"""
+    with _statistics_lock:
+        stats = _statistics.get(graph)
+        if stats is None:
+            stats = _statistics[graph] = Statistics(graph)
+        return stats
+
+
+def plan(triples, filters, stats, bound=()):
+    """Greedy evaluation order of triple patterns
+
+    At each step the pattern with the fewest estimated matches, given
+    the variables already bound, goes next. A pattern completing the
+    variables of selective filters counts as matching fewer. filters are
+    (expression, variables, selectivity) tuples, each checked right after
+    the step binding its last variable. Returns a list of
+    (triple, filters, estimated rows after this step).
+    """
+    bound = set(bound)
+    remaining = list(triples)
+    pending = list(filters)
+    steps = []
+    rows = 1.0
+    while remaining:
+        best = None
+        for triple in remaining:
+            after = bound | _pattern_variables(triple)
+            ready = [f for f in pending if f[1] <= after]
+            cost = stats.estimate(triple, bound)
+            for f in ready:
+                cost *= f[2]
+            if best is None or cost < best[0]:
+                best = (cost, triple, ready, after)
+        cost, triple, ready, bound = best
+        remaining.remove(triple)
+        pending = [f for f in pending if not any(f is r for r in ready)]
+        rows *= cost
+        steps.append((triple, sorted(ready, key=lambda f: f[2]), rows))
+    return steps
+
+
+def _default_order(triples, bound):
+    # What rdflib's evalPart runs: fewest unbound terms first, otherwise as written
+    return sorted(triples, key=lambda t: len([x for x in t if _is_variable(x) and x not in bound]))
+
+
+def _intermediate_rows(order, stats, bound):
+    bound = set(bound)
+    rows = total = 1.0
+    for triple in order:
+        rows *= stats.estimate(triple, bound)
+        bound |= _pattern_variables(triple)
+        total += rows
+    return total
+
+
+def _planned(part, stats, conditions):
+    """Copy of a BGP node with the conditions it can check, and the other conditions"""
+    variables = set().union(*(_pattern_variables(t) for t in part.triples))
+    accepted = [c for c in conditions if part.triples and _variables(c) <= variables]
+    rejected = [c for c in conditions if not any(c is a for a in accepted)]
+    predicates = {o: p for s, p, o in part.triples if isinstance(o, Variable) and not _is_variable(p)}
+    node = part.clone()
+    node['variables'] = list(variables)
+    node['filters'] = [(c, _variables(c), stats.selectivity(c, predicates)) for c in accepted]
+    node['statistics'] = stats
+    node['plans'] = {}
+    return node, rejected
+
+
+def _rewrite(part, stats, conditions=()):
+    """Copy of an algebra node with planned BGPs
+
+    conditions are FILTER conjuncts from an enclosing Filter, moved into
+    the BGPs that bind all of their variables. Returns the new node and
+    the conditions that could not be moved.
+    """
+    if not isinstance(part, CompValue):
+        return part, list(conditions)
+    if part.name == 'BGP':
+        return _planned(part, stats, conditions)
+
+    node = part.clone()
+    if part.name == 'Filter':
+        own = _conjuncts(part.expr)
+        movable = [c for c in own if not _names(c) & UNMOVABLE]
+        child, rejected = _rewrite(part.p, stats, list(conditions) + movable)
+        # Unmovable conditions were never passed down and are always kept
+        kept = [c for c in own
+                if not any(c is m for m in movable) or any(c is r for r in rejected)]
+        rejected = [c for c in rejected if not any(c is k for k in own)]
+        if len(kept) == len(own):
+            node['p'] = child
+            return node, rejected
+        # Remaining conditions are nested Filters with the original scope
+        for c in kept:
+            node = part.clone()
+            node['expr'] = c
+            node['p'] = child
+            child = node
+        return child, rejected
+    if part.name == 'Join':
+        node['p1'], rejected = _rewrite(part.p1, stats, conditions)
+        node['p2'], rejected = _rewrite(part.p2, stats, rejected)
+        return node, rejected
+    if part.name == 'LeftJoin':
+        # Only the required side binds its variables for every solution
+        node['p1'], rejected = _rewrite(part.p1, stats, conditions)
+        node['p2'], _ = _rewrite(part.p2, stats)
+        return node, rejected
+    if part.name == 'Extend':
+        passed = [c for c in conditions if part.var not in _variables(c)]
+        node['p'], rejected = _rewrite(part.p, stats, passed)
+        return node, rejected + [c for c in conditions if part.var in _variables(c)]
+    for key in ('p', 'p1', 'p2'):
+        if isinstance(part.get(key), CompValue):
+            node[key], _ = _rewrite(part[key], stats)
+    return node, list(conditions)
+
+
+def optimize(query, graph, stats=None):
+    """Copy of a prepared query (or query text) with its BGPs planned for graph"""
+    if isinstance(query, str):
+        query = prepare_query(query, graph.namespaces())
+    stats = stats or statistics(graph)
+    stats.refresh()
+    algebra, _ = _rewrite(query.algebra, stats)
+    optimized = Query(query.prologue, algebra)
+    if hasattr(query, '_original_args'):
+        optimized._original_args = query._original_args
+    return optimized
+
+
+def _evaluate(ctx, part):
+    """rdflib custom evaluation of the BGPs rewritten by optimize()"""
+    if part.name != 'BGP' or part.statistics is None:
+        raise NotImplementedError()
+    # Planned again for each set of variables bound by the enclosing pattern
+    bound = frozenset(v for v in part.variables if ctx[v] is not None)
+    steps = part.plans.get(bound)
+    if steps is None:
+        steps = part.plans[bound] = plan(part.triples, part.filters, part.statistics, bound)
+    return _evaluate_steps(ctx, steps, 0)
+
+
+def _evaluate_steps(ctx, steps, i):
+    # rdflib's evalBGP, with the filters of each step checked right after it
+    if i == len(steps):
+        yield ctx.solution()
+        return
+    (s, p, o), filters, _ = steps[i]
+    _s, _p, _o = ctx[s], ctx[p], ctx[o]
+    for ss, sp, so in ctx.graph.triples((_s, _p, _o)):
+        c = ctx.push() if None in (_s, _p, _o) else ctx
+        try:
+            if _s is None:
+                c[s] = ss
+            if _p is None:
+                c[p] = sp
+            if _o is None:
+                c[o] = so
+        except AlreadyBound:
+            continue
+        if filters:
+            solution = c.solution()
+            if not all(_ebv(f[0], solution) for f in filters):
+                continue
+        yield from _evaluate_steps(c, steps, i + 1)
+
+
+CUSTOM_EVALS['query_optimizer'] = _evaluate
+
+
+def _term(term, namespaces):
+    if isinstance(term, Variable):
+        return term.n3()
+    if isinstance(term, CompValue):
+        return _expression(term, namespaces)
+    if isinstance(term, (list, tuple)):
+        return '(' + ', '.join(_term(t, namespaces) for t in term) + ')'
+    return term.n3(namespaces)
+
+
+def _expression(expr, namespaces):
+    """Readable text of a FILTER expression"""
+    name = expr.name
+    if name in ('ConditionalAndExpression', 'ConditionalOrExpression'):
+        op = ' && ' if name == 'ConditionalAndExpression' else ' || '
+        return op.join(_term(e, namespaces) for e in [expr.expr] + list(expr.other or []))
+    if name == 'RelationalExpression':
+        return f"{_term(expr.expr, namespaces)} {expr.op} {_term(expr.other, namespaces)}"
+    if name == 'UnaryNot':
+        return '!' + _term(expr.expr, namespaces)
+    if name.startswith('Builtin_'):
+        args = [_term(v, namespaces) for k, v in expr.items() if not k.startswith('_') and v is not None]
+        if name in UNMOVABLE:
+            args = ['{...}']
+        return f"{name[len('Builtin_'):]}({', '.join(args)})"
+    return name
+
+
+def _rows(count):
+    return f"{count:,.0f}" if count >= 10 else f"{count:.2g}"
+
+
+def _describe(part, namespaces, bound, lines, depth):
+    indent = '  ' * depth
+    if part.name == 'BGP':
+        steps = plan(part.triples, part.filters, part.statistics, bound) if part.triples else []
+        chosen = 1.0 + sum(rows for _, _, rows in steps)
+        default = _intermediate_rows(_default_order(part.triples, bound), part.statistics, bound)
+        lines.append(f"{indent}BGP: est. {_rows(steps[-1][2] if steps else 1)} rows, "
+                     f"{_rows(chosen)} intermediate rows (rdflib's order: {_rows(default)})")
+        for i, (triple, filters, rows) in enumerate(steps, 1):
+            text = ' '.join(_term(t, namespaces) for t in triple)
+            lines.append(f"{indent}  {i}. {text}  -> est. {_rows(rows)}")
+            for expr, _, share in filters:
+                lines.append(f"{indent}       FILTER {_term(expr, namespaces)}  (keeps ~{share:.0%})")
+        return
+    label = part.name
+    if part.name == 'Filter':
+        label += ' ' + _term(part.expr, namespaces)
+    elif part.name == 'LeftJoin' and isinstance(part.expr, CompValue) and part.expr.name != 'TrueFilter':
+        label += ' ' + _term(part.expr, namespaces)
+    elif part.name == 'Project':
+        label += ' ' + ' '.join(v.n3() for v in part.PV)
+    lines.append(indent + label)
+    if part.name == 'LeftJoin':
+        _describe(part.p1, namespaces, bound, lines, depth + 1)
+        _describe(part.p2, namespaces, bound | set(part.p1._vars or ()), lines, depth + 1)
+        return
+    for key in ('p', 'p1', 'p2'):
+        if isinstance(part.get(key), CompValue):
+            _describe(part[key], namespaces, bound, lines, depth + 1)
+
+
+def explain(query, graph, stats=None):
+    """Text of the plan optimize() chooses for query on graph"""
+    optimized = optimize(query, graph, stats)
+    lines = []
+    _describe(optimized.algebra, graph.namespace_manager, frozenset(), lines, 0)
+    return '\n'.join(lines)
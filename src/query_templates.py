@@ -0,0 +1,129 @@
+"""Parameterized SPARQL query templates
+
+A template is a SPARQL query where parameters are written as $name
+variables, e.g. `?city dbo:country $country ... LIMIT $limit`. Values are
+checked against the declared parameter types and turned into exactly one
+RDF term, so they cannot change the structure of the query.
+
+Locally the template is parsed once with prepare_query and values are
+passed as initBindings; remote queries get the terms substituted into the
+text. Parameters used in LIMIT/OFFSET are always substituted, and the
+prepared query is cached per distinct value.
+"""
+
+import datetime
+import re
+
+from rdflib import URIRef, Literal
+from rdflib.namespace import RDFS, XSD
+
+from rdf_utils import nt_term, prepare_query
+from query_optimizer import optimize
+from query_examples import TEMPLATES
+
+_INVALID_IRI_RE = re.compile(r'[<>"{}|^`\\\s]')
+_PARAM_RE = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)\b')
+_MAX_PREPARED = 32
+
+
+def to_term(value, type_):
+    """Convert a parameter value to an RDF term of the declared type"""
+    if type_ is URIRef:
+        value = str(value)
+        if _INVALID_IRI_RE.search(value):
+            raise ValueError(f"Invalid IRI: {value!r}")
+        return URIRef(value)
+    if type_ is int:
+        if isinstance(value, bool):
+            raise ValueError(f"Expected an integer, got {value!r}")
+        return Literal(int(value))
+    if type_ is float:
+        return Literal(float(value))
+    if type_ is datetime.date:
+        if not isinstance(value, datetime.date):
+            value = datetime.date.fromisoformat(str(value))
+        return Literal(value.isoformat(), datatype=XSD.date)
+    if type_ is Literal:
+        return value if isinstance(value, Literal) else Literal(str(value))
+    if type_ is str:
+        return Literal(str(value))
+    raise TypeError(f"Unsupported parameter type {type_!r}")
+
+
+class QueryTemplate:
+    def __init__(self, name, text, params, namespaces=None):
+        self.name = name
+        self.text = text
+        self.params = params
+        self.namespaces = dict(namespaces or {'rdfs': RDFS})
+        used = set(_PARAM_RE.findall(text))
+        if used != set(params):
+            raise ValueError(f"Template {name}: parameters {sorted(used)} declared as {sorted(params)}")
+        # Parameters that cannot be variables in SPARQL syntax
+        self.inline = set(re.findall(r'\b(?:LIMIT|OFFSET)\s+\$([A-Za-z_]\w*)', text, re.I))
+        for param in self.inline:
+            if params[param] is not int:
+                raise ValueError(f"Template {name}: ${param} is used in LIMIT/OFFSET and must be int")
+        self._prepared = {}
+
+    def terms(self, values):
+        """Check values against the declared parameters and convert them"""
+        missing = set(self.params) - set(values)
+        unknown = set(values) - set(self.params)
+        if missing or unknown:
+            raise ValueError(f"Template {self.name}: missing {sorted(missing)}, unknown {sorted(unknown)}")
+        return {name: to_term(value, self.params[name]) for name, value in values.items()}
+
+    def _substitute(self, text, terms, names):
+        def replace(match):
+            name = match.group(1)
+            if name not in names:
+                return match.group(0)
+            term = terms[name]
+            return str(term) if name in self.inline else nt_term(term)
+        return _PARAM_RE.sub(replace, text)
+
+    def render(self, **values):
+        """Query text with every parameter substituted, for remote endpoints"""
+        return self._substitute(self.text, self.terms(values), self.params)
+
+    def prepared(self, **values):
+        """Prepared query and initBindings for local evaluation"""
+        terms = self.terms(values)
+        key = tuple(int(terms[name]) for name in sorted(self.inline))
+        prepared = self._prepared.get(key)
+        if prepared is None:
+            if len(self._prepared) >= _MAX_PREPARED:
+                self._prepared.clear()
+            text = self._substitute(self.text, terms, self.inline)
+            prepared = self._prepared[key] = prepare_query(text, self.namespaces)
+        bindings = {name: term for name, term in terms.items() if name not in self.inline}
+        return prepared, bindings
+
+    def query(self, graph, **values):
+        """Run the template against a local graph"""
+        prepared, bindings = self.prepared(**values)
+        return graph.query(optimize(prepared, graph), initBindings=bindings)
+
+
+class TemplateRegistry:
+    def __init__(self):
+        self.templates = {}
+
+    def register(self, name, text, namespaces=None, **params):
+        """Add a template, declaring each $parameter with its type"""
+        template = QueryTemplate(name, text, params, namespaces)
+        self.templates[name] = template
+        return template
+
+    def get(self, name):
+        return self.templates[name]
+
+    def __contains__(self, name):
+        return name in self.templates
+
+
+registry = TemplateRegistry()
+
+for _name, _spec in TEMPLATES.items():
+    registry.register(_name, _spec['query'], **_spec['params'])
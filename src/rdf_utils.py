@@ -1,11 +1,60 @@
 """Utility functions for RDF data handling"""
 
-from rdflib import Graph, URIRef, Literal
+import gzip
+import hashlib
+import mmap
+import re
+import struct
+import sys
+import threading
+from array import array
+
+from rdflib import Graph, ConjunctiveGraph, URIRef, Literal, BNode, plugin
 from rdflib.namespace import RDF, RDFS, FOAF
+from rdflib.store import Store, VALID_STORE
+from rdflib.plugins.sparql import prepareQuery
+
+from metrics import timed
+from ntriples import unescape_nt
+
+plugin.register('SQLite', Store, 'sqlite_store', 'SQLiteStore')
+
+# Binary snapshot layout: header, term offsets (uint64), term blob, triples (uint32 ids)
+SNAPSHOT_MAGIC = b"RDFSNAP1"
+SNAPSHOT_HEADER = struct.Struct("<8s32sBxxxIQQ")
+SNAPSHOT_SUFFIX = ".snap"
+
+BATCH_SIZE = 10000
+_NT_TERM_RE = re.compile(
+    r'\s*(?:<(?P<uri>[^>]*)>'
+    r'|_:(?P<bnode>[^\s<>"]+?)(?=[\s<"]|\.?\s*$)'
+    r'|"(?P<literal>(?:[^"\\]|\\.)*)"(?:@(?P<lang>[A-Za-z0-9-]+)|\^\^<(?P<datatype>[^>]*)>)?)')
+
+# rdflib's SPARQL grammar is not thread-safe: concurrent parses can leave it
+# broken for the rest of the process, so local parsing goes through this lock
+_PARSE_LOCK = threading.Lock()
 
-def create_graph():
-    """Create and return a new RDF graph"""
-    return Graph()
+def prepare_query(query, namespaces=None):
+    """Parse a SPARQL query into rdflib algebra, safe to call from any thread"""
+    with _PARSE_LOCK:
+        return prepareQuery(query, initNs=dict(namespaces or {}))
+
+def create_graph(store='default', path=None):
+    """Create and return a new RDF graph
+
+    store='SQLite' keeps the triples in an indexed SQLite file at path
+    instead of memory; reopening the same path gives back its triples.
+    Its writes are committed in batches and at exit; call graph.commit()
+    to make them durable right away, and note that rdflib's graph.close()
+    rolls back uncommitted writes unless commit_pending_transaction=True.
+    Any other rdflib store name or Store instance is passed to Graph.
+    """
+    graph = Graph(store=store)
+    if path is not None:
+        if graph.open(path, create=True) != VALID_STORE:
+            print(f"Error opening store at {path}")
+            return None
+    return graph
 
 def add_triple(graph, subject, predicate, object_):
     """Add a triple to the graph"""
@@ -15,6 +64,36 @@ def add_literal(graph, subject, predicate, literal):
     """Add a literal value to the graph"""
     graph.add((URIRef(subject), URIRef(predicate), Literal(literal)))
 
+def bulk_add(graph, triples, batch_size=BATCH_SIZE):
+    """Add many triples in batches and return how many were added
+
+    Items are (subject, predicate, object) tuples of rdflib terms; plain
+    strings are taken as IRIs and converted once per distinct value.
+    """
+    iris = {}
+
+    def term(value):
+        if isinstance(value, str) and not isinstance(value, (URIRef, Literal, BNode)):
+            iri = iris.get(value)
+            if iri is None:
+                iri = iris[value] = URIRef(value)
+            return iri
+        return value
+
+    count = 0
+    batch = []
+    for s, p, o in triples:
+        batch.append((term(s), term(p), term(o), graph))
+        if len(batch) >= batch_size:
+            graph.addN(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        graph.addN(batch)
+        count += len(batch)
+    return count
+
+@timed("rdf_save")
 def save_graph(graph, file_path, format='turtle'):
     """Save the graph to a file"""
     try:
@@ -24,12 +103,264 @@ def save_graph(graph, file_path, format='turtle'):
         print(f"Error saving graph: {e}")
         return False
 
-def load_graph(file_path, format='turtle'):
-    """Load a graph from a file"""
+@timed("rdf_load")
+def load_graph(file_path, format='turtle', snapshot=False):
+    """Load a graph from a file
+
+    With snapshot=True, a binary snapshot stored next to the file is
+    used when its checksum matches the file, and written after parsing
+    otherwise, so later loads skip parsing entirely. This writes a
+    <file>.snap file, so it is off by default.
+    """
+    snapshot_path = file_path + SNAPSHOT_SUFFIX
+    if snapshot:
+        graph = load_snapshot(snapshot_path, source_path=file_path)
+        if graph is not None:
+            return graph
     graph = Graph()
     try:
         graph.parse(file_path, format=format)
-        return graph
     except Exception as e:
         print(f"Error loading graph: {e}")
-        return None
\ No newline at end of file
+        return None
+    if snapshot:
+        save_snapshot(graph, snapshot_path, source_path=file_path)
+    return graph
+
+def _open_text(file_path, mode):
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, mode + 't', encoding='utf-8', newline='')
+    return open(file_path, mode, encoding='utf-8', newline='')
+
+def iter_ntriples(file_path):
+    """Yield triples (N-Triples) or quads (N-Quads) from a file, one line at a time
+
+    Files ending in .gz are decompressed on the fly. Blank node labels are
+    mapped to fresh blank nodes, consistently within the file.
+    """
+    bnodes = {}
+    with _open_text(file_path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            terms = []
+            pos = 0
+            while len(terms) < 4:
+                match = _NT_TERM_RE.match(line, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                if match.group('uri') is not None:
+                    terms.append(URIRef(unescape_nt(match.group('uri'))))
+                elif match.group('bnode') is not None:
+                    label = match.group('bnode')
+                    if label not in bnodes:
+                        bnodes[label] = BNode()
+                    terms.append(bnodes[label])
+                else:
+                    datatype = match.group('datatype')
+                    terms.append(Literal(unescape_nt(match.group('literal')),
+                                         lang=match.group('lang'),
+                                         datatype=URIRef(datatype) if datatype else None))
+            if len(terms) < 3 or line[pos:].strip() != '.':
+                raise ValueError(f"{file_path}:{line_number}: invalid N-Triples line")
+            yield tuple(terms)
+
+@timed("rdf_bulk_load")
+def bulk_load(graph, file_path, batch_size=BATCH_SIZE):
+    """Stream an N-Triples/N-Quads file (optionally gzipped) into graph
+
+    Quads go to the matching context when graph is a ConjunctiveGraph or
+    Dataset and triples to its default context, otherwise the graph name
+    is ignored. Returns the number of
+    statements read, or None on error.
+    """
+    contexts = {}
+
+    def context(name):
+        if name not in contexts:
+            contexts[name] = graph.get_context(name)
+        return contexts[name]
+
+    quads = isinstance(graph, ConjunctiveGraph)
+    default = graph.default_context if quads else graph
+    count = 0
+    batch = []
+    try:
+        for terms in iter_ntriples(file_path):
+            target = context(terms[3]) if quads and len(terms) == 4 else default
+            batch.append((terms[0], terms[1], terms[2], target))
+            if len(batch) >= batch_size:
+                graph.addN(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            graph.addN(batch)
+            count += len(batch)
+        return count
+    except Exception as e:
+        print(f"Error loading graph: {e}")
+        return None
+
+def nt_term(term):
+    """Format a term in N-Triples syntax"""
+    if isinstance(term, URIRef):
+        return f"<{term}>"
+    if isinstance(term, BNode):
+        return f"_:{term}"
+    value = (str(term).replace('\\', '\\\\').replace('"', '\\"')
+             .replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'))
+    if term.language:
+        return f'"{value}"@{term.language}'
+    if term.datatype:
+        return f'"{value}"^^<{term.datatype}>'
+    return f'"{value}"'
+
+def json_term(term):
+    """Format a term as a SPARQL JSON results binding value"""
+    if isinstance(term, URIRef):
+        return {"type": "uri", "value": str(term)}
+    if isinstance(term, BNode):
+        return {"type": "bnode", "value": str(term)}
+    result = {"type": "literal", "value": str(term)}
+    if term.language:
+        result["xml:lang"] = term.language
+    elif term.datatype:
+        result["datatype"] = str(term.datatype)
+    return result
+
+@timed("rdf_stream_save")
+def _quads(graph):
+    """Statements of a ConjunctiveGraph, default context triples without a graph name"""
+    default = graph.default_context.identifier
+    for s, p, o, c in graph.quads((None, None, None, None)):
+        # ConjunctiveGraph yields context graphs, Dataset their identifiers
+        name = getattr(c, 'identifier', c)
+        yield (s, p, o) if name is None or name == default else (s, p, o, name)
+
+def stream_save(graph, file_path, batch_size=BATCH_SIZE):
+    """Write a graph to disk line by line as N-Triples
+
+    A ConjunctiveGraph or Dataset is written as N-Quads (default context
+    triples without a graph name), and graph may also
+    be any iterable of triples. A .gz path is gzipped. The serialized
+    document is never built in memory.
+    """
+    try:
+        with _open_text(file_path, 'w') as f:
+            lines = []
+            if isinstance(graph, ConjunctiveGraph):
+                statements = _quads(graph)
+            else:
+                statements = iter(graph)
+            for statement in statements:
+                lines.append(' '.join(nt_term(t) for t in statement) + ' .\n')
+                if len(lines) >= batch_size:
+                    f.writelines(lines)
+                    lines = []
+            f.writelines(lines)
+        return True
+    except Exception as e:
+        print(f"Error saving graph: {e}")
+        return False
+
+def file_checksum(file_path):
+    """SHA-256 digest of a file"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+def _encode_term(term):
+    if isinstance(term, URIRef):
+        return b'U' + str(term).encode('utf-8')
+    if isinstance(term, BNode):
+        return b'B' + str(term).encode('utf-8')
+    if isinstance(term, Literal):
+        return b'\x00'.join((b'L' + str(term).encode('utf-8'),
+                             (term.language or '').encode('utf-8'),
+                             str(term.datatype or '').encode('utf-8')))
+    raise TypeError(f"Cannot snapshot term {term!r}")
+
+def _decode_term(data):
+    kind, text = data[:1], data[1:].decode('utf-8')
+    if kind == b'U':
+        return URIRef(text)
+    if kind == b'B':
+        return BNode(text)
+    # Lexical form may itself contain NUL, so split from the right
+    value, lang, datatype = text.rsplit('\x00', 2)
+    return Literal(value, lang=lang or None, datatype=URIRef(datatype) if datatype else None)
+
+def save_snapshot(graph, snapshot_path, source_path=None):
+    """Write a dictionary-encoded binary snapshot of the graph"""
+    ids = {}
+    offsets = array('Q', [0])
+    blob = bytearray()
+    triples = array('I')
+    try:
+        for triple in graph:
+            for term in triple:
+                term_id = ids.get(term)
+                if term_id is None:
+                    term_id = ids[term] = len(ids)
+                    blob += _encode_term(term)
+                    offsets.append(len(blob))
+                triples.append(term_id)
+        checksum = file_checksum(source_path) if source_path else bytes(32)
+        byteorder = 0 if sys.byteorder == 'little' else 1
+        with open(snapshot_path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, checksum, byteorder,
+                                         len(ids), len(blob), len(triples) // 3))
+            offsets.tofile(f)
+            f.write(blob)
+            triples.tofile(f)
+        return True
+    except Exception as e:
+        print(f"Error saving snapshot: {e}")
+        return False
+
+def load_snapshot(snapshot_path, source_path=None):
+    """Load a graph from a binary snapshot without parsing RDF
+
+    Returns None if the snapshot is missing, corrupt or, when source_path
+    is given, was taken from a different version of that file.
+    """
+    try:
+        with open(snapshot_path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    blob = None
+    try:
+        magic, checksum, byteorder, term_count, blob_size, triple_count = \
+            SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            return None
+        if source_path and checksum != file_checksum(source_path):
+            return None
+        pos = SNAPSHOT_HEADER.size
+        offsets = array('Q', data[pos:pos + 8 * (term_count + 1)])
+        pos += 8 * (term_count + 1)
+        blob = memoryview(data)[pos:pos + blob_size]
+        pos += blob_size
+        ids = array('I', data[pos:pos + 12 * triple_count])
+        if byteorder != (0 if sys.byteorder == 'little' else 1):
+            offsets.byteswap()
+            ids.byteswap()
+        terms = [_decode_term(bytes(blob[offsets[i]:offsets[i + 1]]))
+                 for i in range(term_count)]
+        graph = Graph()
+        graph.addN((terms[ids[i]], terms[ids[i + 1]], terms[ids[i + 2]], graph)
+                   for i in range(0, len(ids), 3))
+        return graph
+    except Exception as e:
+        print(f"Error loading snapshot: {e}")
+        return None
+    finally:
+        # The mmap cannot be closed while a view on it is still exported
+        if blob is not None:
+            blob.release()
+        data.close()
@@ -0,0 +1,158 @@
+"""Incremental parsing of SPARQL JSON, CSV and TSV results
+
+Each parser takes an iterable of byte chunks (e.g. response.iter_content())
+and yields bindings in the same shape as the JSON results format, so only
+the current chunk and the binding being decoded are held in memory.
+"""
+
+import codecs
+import csv
+import json
+import re
+
+from ntriples import unescape_nt
+
+CHUNK_SIZE = 64 * 1024
+
+FORMATS = {
+    'json': "application/sparql-results+json",
+    'csv': "text/csv",
+    'tsv': "text/tab-separated-values",
+}
+
+_BINDINGS_RE = re.compile(r'"bindings"\s*:\s*\[')
+_SEPARATOR_RE = re.compile(r'[\s,]*')
+_TSV_TERM_RE = re.compile(
+    r'^(?:<(?P<uri>[^>]*)>'
+    r'|_:(?P<bnode>\S+)'
+    r'|"(?P<literal>(?:[^"\\]|\\.)*)"(?:@(?P<lang>[A-Za-z0-9-]+)|\^\^<(?P<datatype>[^>]*)>)?)$')
+_XSD = "http://www.w3.org/2001/XMLSchema#"
+
+
+def _decode(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def _lines(chunks):
+    """Split decoded chunks into lines, keeping the line endings"""
+    pending = ''
+    for text in _decode(chunks):
+        *lines, pending = (pending + text).split('\n')
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+
+def iter_json_bindings(chunks):
+    """Yield each binding of a SPARQL JSON result as soon as it is complete"""
+    decoder = json.JSONDecoder()
+    buf = ''
+    in_bindings = False
+    for text in _decode(chunks):
+        buf += text
+        pos = 0
+        if not in_bindings:
+            match = _BINDINGS_RE.search(buf)
+            if match is None:
+                # Keep enough of the tail for a key split across chunks
+                buf = buf[-32:]
+                continue
+            in_bindings = True
+            pos = match.end()
+        while True:
+            pos = _SEPARATOR_RE.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if buf[pos] == ']':
+                return
+            try:
+                binding, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                break
+            yield binding
+        buf = buf[pos:]
+
+
+def _tsv_term(text):
+    if not text:
+        return None
+    match = _TSV_TERM_RE.match(text)
+    if match is None:
+        # Abbreviated numeric and boolean literals
+        if text in ('true', 'false'):
+            datatype = _XSD + 'boolean'
+        elif re.fullmatch(r'[+-]?\d+', text):
+            datatype = _XSD + 'integer'
+        elif re.fullmatch(r'[+-]?\d*\.\d+', text):
+            datatype = _XSD + 'decimal'
+        else:
+            datatype = _XSD + 'double'
+        return {'type': 'literal', 'value': text, 'datatype': datatype}
+    if match.group('uri') is not None:
+        return {'type': 'uri', 'value': match.group('uri')}
+    if match.group('bnode') is not None:
+        return {'type': 'bnode', 'value': match.group('bnode')}
+    term = {'type': 'literal', 'value': unescape_nt(match.group('literal'))}
+    if match.group('lang'):
+        term['xml:lang'] = match.group('lang')
+    elif match.group('datatype'):
+        term['datatype'] = match.group('datatype')
+    return term
+
+
+def iter_tsv_bindings(chunks):
+    """Yield bindings from a SPARQL TSV result, one line at a time"""
+    variables = None
+    for line in _lines(chunks):
+        fields = line.rstrip('\r\n').split('\t')
+        if variables is None:
+            variables = [v.lstrip('?$') for v in fields]
+            continue
+        binding = {}
+        for var, field in zip(variables, fields):
+            term = _tsv_term(field)
+            if term is not None:
+                binding[var] = term
+        yield binding
+
+
+def _csv_term(value):
+    # CSV results carry no term types, IRIs and blank nodes are recognized
+    # by their lexical form and everything else is a plain literal
+    if not value:
+        return None
+    if value.startswith('_:'):
+        return {'type': 'bnode', 'value': value[2:]}
+    if re.match(r'^[A-Za-z][A-Za-z0-9+.-]*://\S*$', value) or value.startswith('urn:'):
+        return {'type': 'uri', 'value': value}
+    return {'type': 'literal', 'value': value}
+
+
+def iter_csv_bindings(chunks):
+    """Yield bindings from a SPARQL CSV result, one record at a time"""
+    reader = csv.reader(_lines(chunks))
+    variables = next(reader, None)
+    if variables is None:
+        return
+    for row in reader:
+        binding = {}
+        for var, value in zip(variables, row):
+            term = _csv_term(value)
+            if term is not None:
+                binding[var] = term
+        yield binding
+
+
+PARSERS = {
+    'json': iter_json_bindings,
+    'csv': iter_csv_bindings,
+    'tsv': iter_tsv_bindings,
+}
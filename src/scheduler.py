@@ -0,0 +1,190 @@
+"""Per-endpoint rate limiting, retries with backoff and circuit breaking"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from config import (RATE_LIMITS, DEFAULT_RATE_LIMIT, MAX_RETRIES, BACKOFF_BASE,
+                    BACKOFF_MAX, BREAKER_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """Raised when an endpoint's circuit breaker is open"""
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` requests per second with bursts of `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = max(0, -self.tokens / self.rate)
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        """Hold every request for the given time (e.g. from Retry-After)"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, sends one trial request after `reset_timeout`"""
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            # Half-open: a single trial request, another one only if it never reported back
+            if self.probe_at is not None and now - self.probe_at < self.reset_timeout:
+                return False
+            self.probe_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_at = None
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+def parse_retry_after(value):
+    """Return the Retry-After header value in seconds, or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """Shared scheduler deciding when requests to each endpoint may be sent
+
+    The sync and async clients drive it the same way: call before_request()
+    and wait the returned delay, send, then ask after_response() or
+    after_error() whether (and after how long) to retry.
+    """
+
+    def __init__(self, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buckets = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _host(self, endpoint):
+        return urlsplit(endpoint).hostname or endpoint
+
+    def bucket(self, endpoint):
+        host = self._host(endpoint)
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(*RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT))
+            return self._buckets[host]
+
+    def breaker(self, endpoint):
+        host = self._host(endpoint)
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET_TIMEOUT)
+            return self._breakers[host]
+
+    def backoff(self, attempt):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def before_request(self, endpoint):
+        """Return the delay to wait before sending, or raise CircuitOpenError"""
+        if not self.breaker(endpoint).allow():
+            raise CircuitOpenError(f"Circuit open for {self._host(endpoint)}")
+        return self.bucket(endpoint).reserve()
+
+    def after_response(self, endpoint, status, retry_after, attempt):
+        """Return the delay before retrying, or None if the response is final"""
+        breaker = self.breaker(endpoint)
+        if status not in RETRY_STATUSES:
+            breaker.record_success()
+            return None
+        # 429 means throttled, not down, so it does not trip the breaker
+        if status != 429:
+            breaker.record_failure()
+        delay = parse_retry_after(retry_after)
+        if delay is not None:
+            # Never block callers longer than backoff_max, give up on longer waits
+            self.bucket(endpoint).pause(min(delay, self.backoff_max))
+            if delay > self.backoff_max:
+                return None
+        if attempt >= self.max_retries:
+            return None
+        return self.backoff(attempt) if delay is None else delay
+
+    def after_error(self, endpoint, attempt):
+        """Return the delay before retrying after a connection error, or None"""
+        self.breaker(endpoint).record_failure()
+        if attempt >= self.max_retries:
+            return None
+        return self.backoff(attempt)
+
+    def execute(self, endpoint, send):
+        """Call send() under rate limiting, retrying throttled or failed requests"""
+        attempt = 0
+        while True:
+            time.sleep(self.before_request(endpoint))
+            try:
+                response = send()
+            except OSError as e:
+                delay = self.after_error(endpoint, attempt)
+                if delay is None:
+                    raise
+                print(f"Request failed ({e}), retrying in {delay:.1f}s")
+            else:
+                delay = self.after_response(endpoint, response.status_code,
+                                            response.headers.get("Retry-After"), attempt)
+                if delay is None:
+                    return response
+                print(f"Error {response.status_code}, retrying in {delay:.1f}s")
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+
+default_scheduler = RequestScheduler()
@@ -0,0 +1,207 @@
+"""Full-text search over the rdfs:label and rdfs:comment literals of a graph
+
+Literals are tokenized according to their language tag (accents folded,
+French elisions split off, common stop words dropped) into an inverted
+index. Searches rank subjects with BM25, labels weighing more than
+comments, and match the last query word as a prefix (search as you type)
+and words with one typo, so a lookup reads a few posting lists instead of
+scanning every label with FILTER(CONTAINS(...)).
+"""
+
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from rdflib import Literal
+from rdflib.namespace import RDFS
+
+FIELDS = {RDFS.label: 2.0, RDFS.comment: 1.0}
+STOP_WORDS = {
+    'en': {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+           'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'with'},
+    'fr': {'a', 'au', 'aux', 'ce', 'ces', 'dans', 'de', 'des', 'du', 'en', 'est', 'et',
+           'la', 'le', 'les', 'par', 'pour', 'que', 'qui', 'sur', 'un', 'une'},
+}
+_ALL_STOP_WORDS = set().union(*STOP_WORDS.values())
+_ELISION_RE = re.compile(r"\b(?:[cdjlmnst]|qu)['’]", re.I)
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+# BM25 parameters, and the weight of prefix and one-typo matches
+K1 = 1.2
+B = 0.75
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+MAX_PREFIX_TERMS = 50
+MIN_FUZZY_LENGTH = 4
+
+
+def fold(text):
+    """Lowercase and strip accents"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text, lang=None):
+    """Index terms of a text, using the stop words of its language"""
+    if lang is None or lang.startswith('fr'):
+        text = _ELISION_RE.sub(' ', text)
+    tokens = _TOKEN_RE.findall(fold(text))
+    stop_words = STOP_WORDS.get((lang or '').split('-')[0], ())
+    return [t for t in tokens if t not in stop_words]
+
+
+def _deletions(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """Levenshtein distance of at most one (one insertion, deletion or substitution)"""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    def __init__(self, graph=None, fields=FIELDS):
+        self.fields = fields
+        self.subjects = []
+        self.labels = []
+        self.lengths = []
+        self.total_length = 0.0
+        self.postings = defaultdict(dict)
+        self._ids = {}
+        self._vocabulary = None
+        self._deletes = None
+        self._lock = threading.Lock()
+        if graph is not None:
+            self.add_graph(graph)
+
+    def add_graph(self, graph):
+        """Index the configured literal properties of every subject"""
+        for field in self.fields:
+            for s, o in graph.subject_objects(field):
+                if isinstance(o, Literal):
+                    self.add(s, field, str(o), o.language)
+        self.prepare()
+
+    def add(self, subject, field, text, lang=None):
+        weight = self.fields[field]
+        with self._lock:
+            doc = self._ids.get(subject)
+            if doc is None:
+                doc = self._ids[subject] = len(self.subjects)
+                self.subjects.append(subject)
+                self.labels.append({})
+                self.lengths.append(0.0)
+            if field == RDFS.label:
+                self.labels[doc].setdefault(lang or '', text)
+            tokens = tokenize(text, lang)
+            self.lengths[doc] += weight * len(tokens)
+            self.total_length += weight * len(tokens)
+            for token in tokens:
+                postings = self.postings[token]
+                postings[doc] = postings.get(doc, 0) + weight
+            self._vocabulary = None
+            self._deletes = None
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def prepare(self):
+        """Build the prefix and typo lookup tables now instead of on the first search"""
+        with self._lock:
+            self._tables()
+
+    def _tables(self):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        if self._deletes is None:
+            deletes = defaultdict(set)
+            for term in self.postings:
+                if len(term) >= MIN_FUZZY_LENGTH - 1:
+                    deletes[term].add(term)
+                    for variant in _deletions(term):
+                        deletes[variant].add(term)
+            self._deletes = deletes
+
+    def _prefix_terms(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+        terms = self._vocabulary[start:end]
+        if len(terms) > MAX_PREFIX_TERMS:
+            # Keep the most frequent completions
+            terms = sorted(terms, key=lambda t: len(self.postings[t]), reverse=True)[:MAX_PREFIX_TERMS]
+        return terms
+
+    def _fuzzy_terms(self, token):
+        candidates = set(self._deletes.get(token, ()))
+        for variant in _deletions(token):
+            candidates |= self._deletes.get(variant, set())
+        return [term for term in candidates if term != token and _within_one_edit(token, term)]
+
+    def _expand(self, token, last, prefix, fuzzy):
+        """Index terms matching a query word, with their weight"""
+        weights = {}
+        if token in self.postings:
+            weights[token] = 1.0
+        if prefix and last:
+            for term in self._prefix_terms(token):
+                weights.setdefault(term, PREFIX_WEIGHT)
+        if fuzzy and len(token) >= MIN_FUZZY_LENGTH:
+            for term in self._fuzzy_terms(token):
+                weights.setdefault(term, FUZZY_WEIGHT)
+        return weights
+
+    def label(self, doc, lang=None):
+        labels = self.labels[doc]
+        for key in (lang, 'en', 'fr', ''):
+            if key is not None and key in labels:
+                return labels[key]
+        return next(iter(labels.values()), str(self.subjects[doc]))
+
+    def search(self, query, limit=10, lang=None, prefix=True, fuzzy=True):
+        """Best matching subjects as dicts with uri, label and score
+
+        Subjects matching more of the query words rank first, then by score.
+        """
+        tokens = tokenize(query, lang)
+        if lang is None:
+            tokens = [t for t in tokens if t not in _ALL_STOP_WORDS] or tokens
+        if not tokens or not self.subjects:
+            return []
+        with self._lock:
+            self._tables()
+            count = len(self.subjects)
+            average = self.total_length / count or 1.0
+            scores = defaultdict(float)
+            matched = defaultdict(int)
+            for i, token in enumerate(tokens):
+                best = {}
+                for term, weight in self._expand(token, i == len(tokens) - 1, prefix, fuzzy).items():
+                    postings = self.postings[term]
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc, tf in postings.items():
+                        norm = tf + K1 * (1 - B + B * self.lengths[doc] / average)
+                        score = weight * idf * tf * (K1 + 1) / norm
+                        if score > best.get(doc, 0):
+                            best[doc] = score
+                for doc, score in best.items():
+                    scores[doc] += score
+                    matched[doc] += 1
+            ranked = heapq.nlargest(limit, scores, key=lambda doc: (matched[doc], scores[doc]))
+            return [{
+                'uri': str(self.subjects[doc]),
+                'label': self.label(doc, lang),
+                'score': round(scores[doc], 4),
+            } for doc in ranked]
@@ -1,20 +1,112 @@
-"""SPARQL client for querying DBPedia"""
-
-from SPARQLWrapper import SPARQLWrapper, JSON
-from config import DBPEDIA_ENDPOINT, DEFAULT_FORMAT, TIMEOUT
-
-class DBPediaClient:
-    def __init__(self):
-        self.sparql = SPARQLWrapper(DBPEDIA_ENDPOINT)
-        self.sparql.setReturnFormat(JSON)
-        self.sparql.setTimeout(TIMEOUT)
-    
-    def query(self, query_string):
-        """Execute a SPARQL query and return results"""
-        self.sparql.setQuery(query_string)
+"""SPARQL clients for querying DBPedia and other endpoints"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (DBPEDIA_ENDPOINT, DEFAULT_FORMAT, TIMEOUT, LOOKUP_BATCH_SIZE, LOOKUP_WORKERS,
+                    LOOKUP_PAGE_SIZE, QUERY_WORKERS)
+from cache import resolve_cache, make_key
+from transport import sparql_request
+from result_stream import CHUNK_SIZE, FORMATS, PARSERS
+from pagination import paginate
+from lookup import fetch_properties
+from query_templates import registry
+from metrics import span
+from singleflight import SingleFlight
+
+class SPARQLClient:
+    """Client for a SPARQL endpoint returning JSON result bindings
+
+    The query is passed to each call and the client's attributes are never
+    changed afterwards, so one instance can be shared by any number of
+    threads (e.g. Flask or gunicorn workers). The session pool, cache,
+    scheduler and mirror it uses are all locked internally.
+    """
+
+    def __init__(self, endpoint, accept=DEFAULT_FORMAT, cache='default', timeout=TIMEOUT,
+                 mirror=None):
+        self.endpoint = endpoint
+        self.accept = accept
+        self.cache = resolve_cache(cache)
+        self.timeout = timeout
+        self.mirror = mirror
+        # Threads missing the cache on the same query share one request
+        self.flights = SingleFlight()
+
+    def query(self, query_string, ttl=None):
+        """Execute a SPARQL query and return results (cached for ttl seconds)
+
+        Queries routed to a synced local mirror are answered from it.
+        """
+        with span(f"{type(self).__name__}.query"):
+            return self._query(query_string, ttl)
+
+    def _query(self, query_string, ttl):
+        if self.mirror is not None:
+            results = self.mirror.answer(self.endpoint, query_string)
+            if results is not None:
+                return results
+        key = make_key(query_string, self.endpoint, self.accept)
+        fetch = lambda: self.flights.do(key, lambda: self._execute(query_string))
+        if self.cache is None:
+            return fetch()
+        return self.cache.get_or_fetch(key, fetch, ttl)
+
+    def _execute(self, query_string):
         try:
-            results = self.sparql.query().convert()
-            return results['results']['bindings']
+            response = sparql_request(self.endpoint, query_string, self.accept, self.timeout)
+            if response.status_code != 200:
+                print(f"Error {response.status_code}: {response.text}")
+                return None
+            with span("json_decode"):
+                return response.json()['results']['bindings']
         except Exception as e:
             print(f"Error executing query: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def query_parallel(self, queries, max_workers=QUERY_WORKERS, ttl=None):
+        """Run queries on a thread pool, returning their results in the same order"""
+        queries = list(queries)
+        if max_workers <= 1 or len(queries) <= 1:
+            return [self.query(q, ttl) for q in queries]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+            return list(executor.map(lambda q: self.query(q, ttl), queries))
+
+    def query_template(self, template, ttl=None, **values):
+        """Execute a registered template (or QueryTemplate) with typed parameter values"""
+        if isinstance(template, str):
+            template = registry.get(template)
+        if self.mirror is not None:
+            results = self.mirror.answer_template(self.endpoint, template.name, values)
+            if results is not None:
+                return results
+        return self.query(template.render(**values), ttl)
+
+    def query_stream(self, query_string, format='json'):
+        """Yield result bindings while the response body is still downloading
+
+        format is 'json', 'csv' or 'tsv'. Streamed results bypass the cache.
+        """
+        try:
+            response = sparql_request(self.endpoint, query_string, FORMATS[format],
+                                      self.timeout, stream=True)
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return
+        with response:
+            if response.status_code != 200:
+                print(f"Error {response.status_code}: {response.text}")
+                return
+            yield from PARSERS[format](response.iter_content(CHUNK_SIZE))
+
+    def query_all(self, query_string, page_size=1000, key=None, prefetch=True, max_rows=None):
+        """Iterate over every row of a SELECT query, fetched page by page"""
+        return paginate(self, query_string, page_size, key, prefetch, max_rows)
+
+    def fetch_properties(self, uris, predicates=None, batch_size=LOOKUP_BATCH_SIZE,
+                         max_workers=LOOKUP_WORKERS, page_size=LOOKUP_PAGE_SIZE):
+        """Properties of many URIs, fetched batch_size URIs per query"""
+        return fetch_properties(self, uris, predicates, batch_size, max_workers, page_size)
+
+class DBPediaClient(SPARQLClient):
+    def __init__(self, endpoint=DBPEDIA_ENDPOINT, cache='default', mirror=None):
+        super().__init__(endpoint, cache=cache, mirror=mirror)
@@ -0,0 +1,410 @@
+"""Local SPARQL 1.1 Protocol endpoint serving graphs loaded with rdf_utils
+
+Usage:
+    python sparql_server.py data.ttl [more files...] [--port 3030]
+
+Queries are accepted as GET ?query=..., form-encoded POST or
+application/sparql-query POST on any path, so the server can stand in for
+DBpedia, Wikidata or the Fuseki dataset used by Project-JS. SELECT and
+ASK results are negotiated as JSON, CSV or TSV and streamed with chunked
+transfer encoding; CONSTRUCT and DESCRIBE return Turtle or N-Triples.
+"""
+
+import argparse
+import csv
+import io
+import json
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from rdflib import Graph, BNode
+from rdflib.plugins.sparql.evaluate import evalQuery
+
+from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, QUERY_TIMEOUT, SERVER_IDLE_TIMEOUT
+from rdf_utils import create_graph, bulk_load, nt_term, json_term, prepare_query
+from query_optimizer import optimize, statistics
+
+CHUNK_SIZE = 64 * 1024
+
+RESULT_TYPES = {
+    'json': "application/sparql-results+json",
+    'csv': "text/csv; charset=utf-8",
+    'tsv': "text/tab-separated-values; charset=utf-8",
+}
+GRAPH_TYPES = {
+    'turtle': "text/turtle; charset=utf-8",
+    'nt': "application/n-triples; charset=utf-8",
+}
+_ACCEPT_ALIASES = {
+    "application/sparql-results+json": 'json',
+    "application/json": 'json',
+    "text/csv": 'csv',
+    "text/tab-separated-values": 'tsv',
+    "text/turtle": 'turtle',
+    "application/n-triples": 'nt',
+    "text/plain": 'nt',
+}
+
+
+class QueryTimeout(Exception):
+    """Raised when a query runs past the server's time limit"""
+
+
+class DeadlineGraph(Graph):
+    """View of a graph whose triple lookups raise QueryTimeout past a deadline
+
+    Queries are evaluated against it, so a query that timed out stops at
+    its next lookup instead of keeping an evaluator thread busy.
+    """
+
+    def __init__(self, graph, deadline):
+        super().__init__(store=graph.store, identifier=graph.identifier,
+                         namespace_manager=graph.namespace_manager)
+        self.deadline = deadline
+
+    def triples(self, triple):
+        if time.monotonic() > self.deadline:
+            raise QueryTimeout()
+        for i, t in enumerate(super().triples(triple), 1):
+            if i % 1000 == 0 and time.monotonic() > self.deadline:
+                raise QueryTimeout()
+            yield t
+
+
+def negotiate(accept, format_param=None):
+    """Pick a result format from a format parameter or an Accept header"""
+    if format_param:
+        return _ACCEPT_ALIASES.get(format_param, format_param)
+    best, best_q = None, -1.0
+    for part in (accept or '').split(','):
+        fields = part.strip().split(';')
+        media = fields[0].strip().lower()
+        q = 1.0
+        for field in fields[1:]:
+            name, _, value = field.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media in _ACCEPT_ALIASES and q > best_q:
+            best, best_q = _ACCEPT_ALIASES[media], q
+    return best
+
+
+def _csv_value(term):
+    if term is None:
+        return ''
+    return f"_:{term}" if isinstance(term, BNode) else str(term)
+
+
+def serialize_select(variables, rows, format):
+    """Yield a SELECT result document piece by piece"""
+    names = [str(v) for v in variables]
+    if format == 'json':
+        yield '{"head": {"vars": %s}, "results": {"bindings": [' % json.dumps(names)
+        separator = ''
+        for row in rows:
+            binding = {name: json_term(term) for name, term in zip(names, row) if term is not None}
+            yield separator + json.dumps(binding, ensure_ascii=False)
+            separator = ',\n'
+        yield ']}}\n'
+    elif format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\r\n')
+        writer.writerow(names)
+        for row in rows:
+            writer.writerow([_csv_value(term) for term in row])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        yield '\t'.join(f"?{name}" for name in names) + '\n'
+        for row in rows:
+            yield '\t'.join(nt_term(term) if term is not None else '' for term in row) + '\n'
+
+
+def serialize_ask(value, format):
+    if format == 'json':
+        return json.dumps({"head": {}, "boolean": value}) + '\n'
+    return ('true' if value else 'false') + '\n'
+
+
+class SPARQLServer(HTTPServer):
+    """HTTP server answering requests from a fixed pool of worker threads
+
+    A worker handles one request at a time. Keep-alive connections waiting
+    for their next request are parked on a selector instead of blocking a
+    worker, and go back to the pool once readable, so more connections
+    than workers can be open at once.
+    """
+
+    def __init__(self, address, graph, workers=SERVER_WORKERS, query_timeout=QUERY_TIMEOUT,
+                 idle_timeout=SERVER_IDLE_TIMEOUT):
+        super().__init__(address, SPARQLRequestHandler)
+        self.graph = graph
+        self.query_timeout = query_timeout
+        self.idle_timeout = idle_timeout
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        # Query evaluation runs separately so a request can give up waiting on it
+        self.evaluators = ThreadPoolExecutor(max_workers=workers)
+        self._selector = selectors.DefaultSelector()
+        self._parked = []
+        self._parked_lock = threading.Lock()
+        self._wakeup, self._waker = socket.socketpair()
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        self._closed = False
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._serve, SPARQLRequestHandler(request, client_address, self))
+
+    def _serve(self, handler):
+        try:
+            handler.close_connection = True
+            handler.handle_one_request()
+            if not handler.close_connection:
+                if handler.pending():
+                    # Pipelined request already buffered, the selector would not see it
+                    self.pool.submit(self._serve, handler)
+                else:
+                    self._park(handler)
+                return
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+        self._close(handler)
+
+    def _park(self, handler):
+        with self._parked_lock:
+            self._parked.append(handler)
+        self._waker.send(b'\0')
+
+    def _close(self, handler):
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.request)
+
+    def _watch(self):
+        """Selector loop handing readable idle connections back to the pool"""
+        while not self._closed:
+            for key, _ in self._selector.select(timeout=1.0):
+                if key.fileobj is self._wakeup:
+                    self._wakeup.recv(4096)
+                    continue
+                self._selector.unregister(key.fileobj)
+                self.pool.submit(self._serve, key.data[0])
+            now = time.monotonic()
+            with self._parked_lock:
+                parked, self._parked = self._parked, []
+            for handler in parked:
+                self._selector.register(handler.connection, selectors.EVENT_READ, (handler, now))
+            for key in list(self._selector.get_map().values()):
+                if key.data is not None and now - key.data[1] > self.idle_timeout:
+                    self._selector.unregister(key.fileobj)
+                    self._close(key.data[0])
+        for key in list(self._selector.get_map().values()):
+            if key.data is not None:
+                self._close(key.data[0])
+        self._selector.close()
+
+    def server_close(self):
+        super().server_close()
+        self._closed = True
+        self._waker.send(b'\0')
+        self._watcher.join()
+        self._wakeup.close()
+        self._waker.close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.evaluators.shutdown(wait=False, cancel_futures=True)
+
+
+class SPARQLRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "SemanticWebSPARQL/1.0"
+    # Headers and body chunks are separate writes, without TCP_NODELAY each
+    # response stalls on the client's delayed ACK
+    disable_nagle_algorithm = True
+    # A client stalling in the middle of a request frees its worker after this
+    timeout = SERVER_IDLE_TIMEOUT
+
+    def __init__(self, request, client_address, server):
+        # SPARQLServer drives the connection one request at a time (handle_one_request)
+        # instead of the base class looping over all of them in the constructor
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.setup()
+
+    def pending(self):
+        """Whether the next request is already buffered in rfile"""
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek())
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def do_GET(self):
+        params = parse_qs(urlsplit(self.path).query)
+        self._answer(params.get('query', [None])[0], params)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        params = parse_qs(urlsplit(self.path).query)
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip()
+        if content_type == 'application/sparql-query':
+            query = body
+        else:
+            params.update(parse_qs(body))
+            query = params.get('query', [None])[0]
+        self._answer(query, params)
+
+    def _error(self, status, message):
+        body = (message + '\n').encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _answer(self, query, params):
+        if not query:
+            self._error(400, "Missing 'query' parameter")
+            return
+        format = negotiate(self.headers.get('Accept'), params.get('format', [None])[0])
+        deadline = time.monotonic() + self.server.query_timeout
+
+        def evaluate():
+            # Evaluated directly rather than through Graph.query so SELECT
+            # bindings come from a generator and are never accumulated
+            graph = DeadlineGraph(self.server.graph, deadline)
+            prepared = optimize(prepare_query(query, graph.namespaces()), graph,
+                                statistics(self.server.graph))
+            result = evalQuery(graph, prepared, {})
+            if result['type_'] == 'SELECT':
+                rows = iter(result['bindings'])
+                # Pull the first row here so the expensive part of the
+                # evaluation happens under the timeout
+                first = next(rows, None)
+                return result, first, rows
+            return result, None, None
+
+        future = self.server.evaluators.submit(evaluate)
+        try:
+            result, first, rows = future.result(timeout=self.server.query_timeout)
+        except (FutureTimeoutError, QueryTimeout):
+            self._error(503, f"Query timed out after {self.server.query_timeout}s")
+            return
+        except Exception as e:
+            self._error(400, f"Query failed: {e}")
+            return
+
+        if result['type_'] == 'ASK':
+            format = format if format in RESULT_TYPES else 'json'
+            body = serialize_ask(bool(result['askAnswer']), format).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', RESULT_TYPES[format])
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif result['type_'] == 'SELECT':
+            format = format if format in RESULT_TYPES else 'json'
+            variables = result['vars_']
+
+            def all_rows():
+                if first is None:
+                    return
+                yield [first.get(v) for v in variables]
+                for binding in rows:
+                    if time.monotonic() > deadline:
+                        raise QueryTimeout()
+                    yield [binding.get(v) for v in variables]
+
+            self._stream(RESULT_TYPES[format], serialize_select(variables, all_rows(), format))
+        else:
+            format = format if format in GRAPH_TYPES else 'turtle'
+            body = result['graph'].serialize(format=format, encoding='utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', GRAPH_TYPES[format])
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def _stream(self, content_type, pieces):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        buffer = []
+        size = 0
+        try:
+            for piece in pieces:
+                data = piece.encode('utf-8')
+                buffer.append(data)
+                size += len(data)
+                if size >= CHUNK_SIZE:
+                    self._write_chunk(b''.join(buffer))
+                    buffer, size = [], 0
+        except QueryTimeout:
+            # Headers are gone already, dropping the connection without the
+            # final chunk tells the client the response is incomplete
+            self.close_connection = True
+            return
+        if buffer:
+            self._write_chunk(b''.join(buffer))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+
+def load_files(paths, store='default', store_path=None):
+    """Load RDF files into one graph, streaming N-Triples/N-Quads files"""
+    graph = create_graph(store, store_path)
+    for path in paths:
+        name = path[:-3] if path.endswith('.gz') else path
+        if name.endswith(('.nt', '.nq')):
+            bulk_load(graph, path)
+        else:
+            graph.parse(path)
+    return graph
+
+
+def serve(graph, host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS,
+          query_timeout=QUERY_TIMEOUT):
+    server = SPARQLServer((host, port), graph, workers, query_timeout)
+    print(f"SPARQL endpoint running on http://{host}:{server.server_port}/sparql")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve RDF files over the SPARQL protocol")
+    parser.add_argument('files', nargs='*', help="RDF files to load (Turtle, RDF/XML, N-Triples, ...)")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS)
+    parser.add_argument('--timeout', type=float, default=QUERY_TIMEOUT)
+    parser.add_argument('--store', help="SQLite file to keep the graph on disk")
+    args = parser.parse_args()
+    graph = load_files(args.files, 'SQLite' if args.store else 'default', args.store)
+    serve(graph, args.host, args.port, args.workers, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
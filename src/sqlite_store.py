@@ -0,0 +1,269 @@
+"""Disk-backed rdflib store keeping triples in an indexed SQLite file
+
+Terms are dictionary-encoded in a `terms` table and triples are stored as
+integer ids with SPO, POS and OSP indexes, so any triple pattern is an
+index lookup. Registered as the "SQLite" store plugin by rdf_utils.
+
+Writes are committed after each addN batch and every _COMMIT_EVERY single
+writes; whatever is still pending is committed by commit(), by
+close(commit_pending_transaction=True) or when the interpreter exits.
+"""
+
+import atexit
+import sqlite3
+import threading
+import weakref
+
+from rdflib import URIRef, Literal, BNode
+from rdflib.store import Store, VALID_STORE, NO_STORE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    lang TEXT NOT NULL DEFAULT '',
+    datatype TEXT NOT NULL DEFAULT '',
+    UNIQUE (kind, value, lang, datatype)
+);
+CREATE TABLE IF NOT EXISTS triples (
+    s INTEGER NOT NULL, p INTEGER NOT NULL, o INTEGER NOT NULL,
+    PRIMARY KEY (s, p, o)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s);
+CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p);
+CREATE TABLE IF NOT EXISTS namespaces (
+    prefix TEXT PRIMARY KEY,
+    uri TEXT NOT NULL UNIQUE
+);
+"""
+
+# Term id and decoded-term caches are dropped once they grow past this size
+_CACHE_LIMIT = 100000
+_FETCH_SIZE = 1000
+_COMMIT_EVERY = 1000
+
+# Stores still open, committed at exit so pending writes are not lost
+_open_stores = weakref.WeakSet()
+
+
+@atexit.register
+def _commit_open_stores():
+    for store in list(_open_stores):
+        try:
+            store.commit()
+        except sqlite3.Error as e:
+            print(f"Error committing store: {e}")
+
+
+def _term_key(term):
+    if isinstance(term, URIRef):
+        return ('U', str(term), '', '')
+    if isinstance(term, BNode):
+        return ('B', str(term), '', '')
+    if isinstance(term, Literal):
+        return ('L', str(term), term.language or '', str(term.datatype or ''))
+    raise TypeError(f"Unsupported term {term!r}")
+
+
+def _make_term(kind, value, lang, datatype):
+    if kind == 'U':
+        return URIRef(value)
+    if kind == 'B':
+        return BNode(value)
+    return Literal(value, lang=lang or None, datatype=URIRef(datatype) if datatype else None)
+
+
+class SQLiteStore(Store):
+    """Triple store persisted in a single SQLite file"""
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = True
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        self.identifier = identifier
+        self._db = None
+        self._pending = 0
+        self._ids = {}
+        self._terms = {}
+        self._lock = threading.RLock()
+        super().__init__(configuration)
+
+    def open(self, configuration, create=True):
+        """Open (and with create, initialise) the SQLite file at configuration"""
+        if not configuration:
+            return NO_STORE
+        try:
+            self._db = sqlite3.connect(configuration, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            if create:
+                self._db.executescript(_SCHEMA)
+            elif self._db.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'triples'").fetchone() is None:
+                return NO_STORE
+        except sqlite3.Error as e:
+            print(f"Error opening store: {e}")
+            return NO_STORE
+        _open_stores.add(self)
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=True):
+        """Close the file, committing or rolling back writes not yet committed"""
+        with self._lock:
+            if self._db is not None:
+                if commit_pending_transaction:
+                    self.commit()
+                else:
+                    self.rollback()
+                self._db.close()
+                self._db = None
+            _open_stores.discard(self)
+
+    def commit(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+            self._pending = 0
+
+    def rollback(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.rollback()
+            self._pending = 0
+            self._ids.clear()
+            self._terms.clear()
+
+    def _written(self, count=1):
+        self._pending += count
+        if self._pending >= _COMMIT_EVERY:
+            self.commit()
+
+    def _id(self, term, create=False):
+        key = _term_key(term)
+        term_id = self._ids.get(key)
+        if term_id is not None:
+            return term_id
+        row = self._db.execute(
+            "SELECT id FROM terms WHERE kind = ? AND value = ? AND lang = ? AND datatype = ?",
+            key).fetchone()
+        if row is not None:
+            term_id = row[0]
+        elif create:
+            term_id = self._db.execute(
+                "INSERT INTO terms (kind, value, lang, datatype) VALUES (?, ?, ?, ?)",
+                key).lastrowid
+        else:
+            return None
+        if len(self._ids) >= _CACHE_LIMIT:
+            self._ids.clear()
+        self._ids[key] = term_id
+        return term_id
+
+    def _term(self, term_id, kind, value, lang, datatype):
+        term = self._terms.get(term_id)
+        if term is None:
+            if len(self._terms) >= _CACHE_LIMIT:
+                self._terms.clear()
+            term = self._terms[term_id] = _make_term(kind, value, lang, datatype)
+        return term
+
+    def add(self, triple, context, quoted=False):
+        with self._lock:
+            s, p, o = (self._id(term, create=True) for term in triple)
+            self._db.execute("INSERT OR IGNORE INTO triples VALUES (?, ?, ?)", (s, p, o))
+            self._written()
+        Store.add(self, triple, context, quoted)
+
+    def addN(self, quads):
+        with self._lock:
+            rows = [tuple(self._id(term, create=True) for term in (s, p, o))
+                    for s, p, o, _ in quads]
+            self._db.executemany("INSERT OR IGNORE INTO triples VALUES (?, ?, ?)", rows)
+            self.commit()
+
+    def _where(self, triple_pattern, alias="t."):
+        """SQL condition and parameters for a pattern, or None if it cannot match"""
+        clauses = []
+        params = []
+        for column, term in zip(('s', 'p', 'o'), triple_pattern):
+            if term is None:
+                continue
+            term_id = self._id(term)
+            if term_id is None:
+                return None
+            clauses.append(f"{alias}{column} = ?")
+            params.append(term_id)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def remove(self, triple_pattern, context=None):
+        with self._lock:
+            where = self._where(triple_pattern, alias="")
+            if where is None:
+                return
+            removed = list(self.triples(triple_pattern)) if self.dispatcher.get_map() else []
+            self._db.execute("DELETE FROM triples" + where[0], where[1])
+            self._written()
+        for triple, _ in removed:
+            Store.remove(self, triple, context)
+
+    def triples(self, triple_pattern, context=None):
+        with self._lock:
+            where = self._where(triple_pattern)
+            if where is None:
+                return
+            cursor = self._db.execute(
+                "SELECT t.s, ts.kind, ts.value, ts.lang, ts.datatype,"
+                " t.p, tp.kind, tp.value, tp.lang, tp.datatype,"
+                " t.o, tob.kind, tob.value, tob.lang, tob.datatype"
+                " FROM triples t"
+                " JOIN terms ts ON ts.id = t.s"
+                " JOIN terms tp ON tp.id = t.p"
+                " JOIN terms tob ON tob.id = t.o" + where[0], where[1])
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(_FETCH_SIZE)
+                triples = [(self._term(*row[0:5]), self._term(*row[5:10]), self._term(*row[10:15]))
+                           for row in rows]
+            if not triples:
+                return
+            for triple in triples:
+                yield triple, iter(())
+
+    def __len__(self, context=None):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace, override=True):
+        with self._lock:
+            if not override and self._db.execute(
+                    "SELECT 1 FROM namespaces WHERE prefix = ? OR uri = ?",
+                    (prefix, str(namespace))).fetchone():
+                return
+            self._db.execute("DELETE FROM namespaces WHERE uri = ?", (str(namespace),))
+            self._db.execute("INSERT OR REPLACE INTO namespaces VALUES (?, ?)",
+                             (prefix, str(namespace)))
+            self._written()
+
+    def namespace(self, prefix):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uri FROM namespaces WHERE prefix = ?", (prefix,)).fetchone()
+        return URIRef(row[0]) if row else None
+
+    def prefix(self, namespace):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT prefix FROM namespaces WHERE uri = ?", (str(namespace),)).fetchone()
+        return row[0] if row else None
+
+    def namespaces(self):
+        with self._lock:
+            rows = self._db.execute("SELECT prefix, uri FROM namespaces").fetchall()
+        for prefix, uri in rows:
+            yield prefix, URIRef(uri)
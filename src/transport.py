@@ -0,0 +1,78 @@
+"""Shared HTTP transport for SPARQL endpoints (pooled keep-alive sessions)"""
+
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (TIMEOUT, POOL_CONNECTIONS, POOL_MAXSIZE,
+                    MAX_GET_QUERY_LENGTH, USER_AGENT)
+from scheduler import default_scheduler
+from metrics import span, upstream_seconds, response_bytes, upstream_errors
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def get_session(endpoint):
+    """Return the pooled session shared by every query sent to the endpoint's host"""
+    parts = urlsplit(endpoint)
+    host = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                                  pool_maxsize=POOL_MAXSIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({
+                "Accept-Encoding": "gzip, deflate",
+                "Connection": "keep-alive",
+                "User-Agent": USER_AGENT,
+            })
+            _sessions[host] = session
+    return session
+
+
+def sparql_request(endpoint, query, accept, timeout=TIMEOUT, stream=False):
+    """Send a SPARQL query and return the raw response
+
+    Short queries use GET, longer ones are sent as a form-encoded POST
+    so they do not hit URL length limits. Requests go through the shared
+    scheduler, which rate limits, retries and may raise CircuitOpenError.
+    """
+    session = get_session(endpoint)
+    headers = {"Accept": accept}
+    host = urlsplit(endpoint).hostname
+
+    def send():
+        try:
+            with span("http"):
+                if len(query) > MAX_GET_QUERY_LENGTH:
+                    response = session.post(endpoint, data={"query": query}, headers=headers,
+                                            timeout=timeout, stream=stream)
+                else:
+                    response = session.get(endpoint, params={"query": query}, headers=headers,
+                                           timeout=timeout, stream=stream)
+        except Exception as e:
+            upstream_errors.inc(endpoint=host, reason=type(e).__name__)
+            raise
+        # elapsed stops at the response headers, the rest of "http" is the download
+        upstream_seconds.observe(response.elapsed.total_seconds(), endpoint=host)
+        if response.status_code != 200:
+            upstream_errors.inc(endpoint=host, reason=str(response.status_code))
+        elif not stream:
+            response_bytes.observe(len(response.content), endpoint=host)
+        return response
+
+    return default_scheduler.execute(endpoint, send)
+
+
+def close_sessions():
+    """Close every pooled session"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -1,15 +1,7 @@
-import requests
+from config import WIKIDATA_ENDPOINT
+from sparql_client import SPARQLClient
 
-class WikidataClient:
-    def __init__(self, endpoint="https://query.wikidata.org/sparql"):
-        self.endpoint = endpoint
-
-    def query(self, sparql_query):
-        headers = {"Accept": "application/sparql-results+json"}
-        response = requests.get(self.endpoint, params={"query": sparql_query}, headers=headers)
-
-        if response.status_code == 200:
-            return response.json()["results"]["bindings"]
-        else:
-            print(f"Error {response.status_code}: {response.text}")
-            return None
+class WikidataClient(SPARQLClient):
+    def __init__(self, endpoint=WIKIDATA_ENDPOINT, cache='default', mirror=None):
+        super().__init__(endpoint, accept="application/sparql-results+json", cache=cache,
+                         mirror=mirror)
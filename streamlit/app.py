@@ -2,7 +2,18 @@ import streamlit as st
 from rdflib import Graph, RDF, OWL, RDFS, Namespace, URIRef
 import pandas as pd
 from streamlit_agraph import agraph, Node, Edge, Config
+import hashlib
 import io
+import os
+import sys
+from ontology_index import OntologyIndex
+
+# Shared graph utilities live in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from inference import materialize
+from search_index import SearchIndex
+from query_optimizer import optimize, explain
+import rdf_utils
 
 st.set_page_config(
     page_title="E-commerce Ontology Explorer",
@@ -17,73 +28,114 @@ uploaded_file = st.sidebar.file_uploader("Upload OWL file", type=['owl', 'xml'])
 
 if 'graph' not in st.session_state:
     st.session_state.graph = None
+    st.session_state.index = None
+    st.session_state.file_hash = None
+
+@st.cache_resource(show_spinner=False)
+def load_ontology(file_hash, _content):
+    """Parse, reason over and index an uploaded ontology once per distinct file content"""
+    g = Graph()
+    g.parse(data=_content, format='xml')
+    reasoner = materialize(g, key=file_hash)
+    return OntologyIndex(g, reasoner.inferred)
+
+@st.cache_resource(show_spinner=False)
+def inferred_closure(file_hash, _index):
+    """Asserted plus inferred triples, for queries relying on RDFS/OWL reasoning"""
+    return materialize(_index.graph, key=file_hash).closure()
+
+@st.cache_resource(show_spinner=False)
+def search_index(file_hash, _index):
+    """Label search index over the ontology, built once per file"""
+    return SearchIndex(_index.graph)
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def prepare_query(query, namespaces):
+    """Parse and translate a SPARQL query once, re-runs reuse the algebra"""
+    # rdflib's parser is not thread-safe, rdf_utils serializes parsing
+    return rdf_utils.prepare_query(query, namespaces)
+
+# E-commerce example queries, shown in the "Example Queries" tab with their plan
+EXAMPLE_QUERIES = [
+    ("List all products and their prices:", """SELECT ?product ?price
+WHERE {
+    ?p a <http://webprotege.stanford.edu/R8JN9OAQRp5oI4RTqxxD5w8> ;
+       rdfs:label ?product ;
+       <http://webprotege.stanford.edu/RX1EIoIlDlnw04HOLQvOn5> ?price .
+}"""),
+    ("Find all orders and their status:", """SELECT ?order ?status
+WHERE {
+    ?o a <http://webprotege.stanford.edu/R7ov25FBIgKeXhWYXPEj1Ek> ;
+       rdfs:label ?order ;
+       <http://webprotege.stanford.edu/RK7sV7gFzu0dZNM607ho1y> ?status .
+}"""),
+    ("List all users and their roles:", """SELECT ?user ?email ?role
+WHERE {
+    ?u a <http://webprotege.stanford.edu/RCDV3qJJ1DAbDbX7qBz5jUi> ;
+       rdfs:label ?user ;
+       <http://webprotege.stanford.edu/RDWXxGjYsCGV4ZCWkZKCYlt> ?email ;
+       <http://webprotege.stanford.edu/RDm6E5QkiPPy7MSp1lmUjkn> ?role .
+}"""),
+    ("Find all product reviews and ratings:", """SELECT ?product ?rating ?comment
+WHERE {
+    ?r a <http://webprotege.stanford.edu/R7f02opMCTF0ty77OqhVpMY> ;
+       <http://webprotege.stanford.edu/RDYnxwoVn6L224Ck4eZvlI2> ?p ;
+       <http://webprotege.stanford.edu/RMn347iR5qdPSx9qM5WxEf> ?rating ;
+       <http://webprotege.stanford.edu/RBwIrRJM9TFRo7rB20yeiYH> ?comment .
+    ?p rdfs:label ?product .
+}"""),
+    ("List all payments and their methods:", """SELECT ?payment ?method ?amount ?date
+WHERE {
+    ?p a <http://webprotege.stanford.edu/RDonsgcbIVN6ZlHAMZjsYzQ> ;
+       rdfs:label ?payment ;
+       <http://webprotege.stanford.edu/R7w5EqCThkGttfTtndrTgRl> ?method ;
+       <http://webprotege.stanford.edu/RDM3I85VLUM29EMGRlmypWI> ?amount ;
+       <http://webprotege.stanford.edu/RDNfrR7G7Dx04C2I8EJlXAc> ?date .
+}"""),
+]
 
 # Load OWL data
 if uploaded_file is not None:
     with st.spinner("Loading ontology data..."):
         try:
-            content = uploaded_file.read().decode()
-            g = Graph()
-            g.parse(data=content, format='xml')
-            st.session_state.graph = g
+            data = uploaded_file.getvalue()
+            file_hash = hashlib.sha256(data).hexdigest()
+            index = load_ontology(file_hash, data.decode())
+            st.session_state.graph = index.graph
+            st.session_state.index = index
+            st.session_state.file_hash = file_hash
             st.success("Successfully loaded ontology!")
         except Exception as e:
             st.error(f"Error loading data: {str(e)}")
 
 if st.session_state.graph is not None:
     g = st.session_state.graph
+    index = st.session_state.index
+
+    # Search classes and instances by label
+    search = st.text_input("Search", placeholder="Label or part of a label, typos allowed")
+    if search:
+        matches = search_index(st.session_state.file_hash, index).search(search, limit=20)
+        if matches:
+            for match in matches:
+                if match['uri'] in index.instances:
+                    match['type'] = index.instances[match['uri']]['class']
+                elif match['uri'] in index.classes:
+                    match['type'] = "Class"
+                else:
+                    match['type'] = ""
+            st.dataframe(pd.DataFrame(matches, columns=['label', 'type', 'uri', 'score']))
+        else:
+            st.info("No matching labels")
     
     # Create tabs for different views
     tab1, tab2, tab3, tab4 = st.tabs(["Entity View", "Classes & Properties", "SPARQL Query", "Example Queries"])
     
     with tab1:
-        # Get class hierarchy and relationships
-        classes = {}
-        class_relations = []
-        instances = {}
-        instance_relations = []
-        
-        # Get all classes and their labels
-        for s, p, o in g.triples((None, RDF.type, OWL.Class)):
-            label = g.value(s, RDFS.label)
-            if label:
-                classes[str(s)] = str(label)
-        
-        # Get all instances and their classes
-        for s, p, o in g.triples((None, RDF.type, None)):
-            if isinstance(o, URIRef) and str(o) in classes:
-                label = g.value(s, RDFS.label)
-                if label:
-                    instances[str(s)] = {
-                        'uri': str(s),
-                        'label': str(label),
-                        'class': classes[str(o)]
-                    }
-        
-        # Get object properties between classes
-        for s, p, o in g.triples((None, RDFS.domain, None)):
-            if str(o) in classes and g.value(s, RDF.type) == OWL.ObjectProperty:
-                pred_label = g.value(s, RDFS.label)
-                range_class = g.value(s, RDFS.range)
-                if pred_label and range_class and str(range_class) in classes:
-                    class_relations.append({
-                        'source': classes[str(o)],
-                        'predicate': str(pred_label),
-                        'target': classes[str(range_class)]
-                    })
-        
-        # Get relationships between instances
-        for s, p, o in g.triples((None, None, None)):
-            if (isinstance(s, URIRef) and isinstance(o, URIRef) and 
-                str(s) in instances and str(o) in instances and 
-                p not in [RDF.type, RDFS.label]):
-                pred_label = g.value(p, RDFS.label)
-                if pred_label:
-                    instance_relations.append({
-                        'source': instances[str(s)]['label'],
-                        'predicate': str(pred_label),
-                        'target': instances[str(o)]['label']
-                    })
+        classes = index.classes
+        class_relations = index.class_relations
+        instances = index.instances
+        instance_relations = index.instance_relations
         
         # Display Statistics
         st.subheader("Statistics")
@@ -186,16 +238,7 @@ if st.session_state.graph is not None:
         
         # Classes section
         st.markdown("### Classes")
-        class_data = []
-        for s, p, o in g.triples((None, RDF.type, OWL.Class)):
-            label = g.value(s, RDFS.label)
-            comment = g.value(s, RDFS.comment)
-            if label:
-                class_data.append({
-                    'URI': str(s),
-                    'Label': str(label),
-                    'Comment': str(comment) if comment else ''
-                })
+        class_data = index.class_table
         
         if class_data:
             st.dataframe(pd.DataFrame(class_data))
@@ -204,24 +247,7 @@ if st.session_state.graph is not None:
         
         # Properties section
         st.markdown("### Object Properties")
-        obj_prop_data = []
-        for s, p, o in g.triples((None, RDF.type, OWL.ObjectProperty)):
-            label = g.value(s, RDFS.label)
-            comment = g.value(s, RDFS.comment)
-            domain = g.value(s, RDFS.domain)
-            range_ = g.value(s, RDFS.range)
-            
-            domain_label = g.value(domain, RDFS.label) if domain else None
-            range_label = g.value(range_, RDFS.range) if range_ else None
-            
-            if label:
-                obj_prop_data.append({
-                    'URI': str(s),
-                    'Label': str(label),
-                    'Domain': str(domain_label) if domain_label else str(domain),
-                    'Range': str(range_label) if range_label else str(range_),
-                    'Comment': str(comment) if comment else ''
-                })
+        obj_prop_data = index.object_property_table
         
         if obj_prop_data:
             st.dataframe(pd.DataFrame(obj_prop_data))
@@ -229,23 +255,7 @@ if st.session_state.graph is not None:
             st.info("No object properties found in the ontology")
         
         st.markdown("### Data Properties")
-        data_prop_data = []
-        for s, p, o in g.triples((None, RDF.type, OWL.DatatypeProperty)):
-            label = g.value(s, RDFS.label)
-            comment = g.value(s, RDFS.comment)
-            domain = g.value(s, RDFS.domain)
-            range_ = g.value(s, RDFS.range)
-            
-            domain_label = g.value(domain, RDFS.label) if domain else None
-            
-            if label:
-                data_prop_data.append({
-                    'URI': str(s),
-                    'Label': str(label),
-                    'Domain': str(domain_label) if domain_label else str(domain),
-                    'Range': str(range_),
-                    'Comment': str(comment) if comment else ''
-                })
+        data_prop_data = index.data_property_table
         
         if data_prop_data:
             st.dataframe(pd.DataFrame(data_prop_data))
@@ -255,23 +265,39 @@ if st.session_state.graph is not None:
     with tab3:
         st.subheader("SPARQL Query")
         query = st.text_area("Enter your SPARQL query:", height=200)
-        if st.button("Execute Query"):
+        use_inferred = st.checkbox("Include inferred triples (subclasses, subproperties, inverses...)")
+        use_optimizer = st.checkbox("Reorder joins and filters using the graph's statistics", value=True)
+        col1, col2 = st.columns(2)
+        run = col1.button("Execute Query")
+        if col2.button("Explain"):
+            if query:
+                try:
+                    target = inferred_closure(st.session_state.file_hash, index) if use_inferred else g
+                    st.code(explain(prepare_query(query.strip(), tuple(g.namespaces())), target))
+                except Exception as e:
+                    st.error(f"Error planning query: {str(e)}")
+            else:
+                st.warning("Please enter a query before explaining it.")
+        if run:
             if query:
                 try:
-                    results = g.query(query)
-                    results_list = []
-                    for row in results:
-                        row_dict = {}
-                        for i, var in enumerate(results.vars):
-                            value = row[i]
-                            if value:
-                                label = g.value(value, RDFS.label)
-                                row_dict[var] = str(label) if label else str(value)
-                        results_list.append(row_dict)
+                    target = inferred_closure(st.session_state.file_hash, index) if use_inferred else g
+                    prepared = prepare_query(query.strip(), tuple(g.namespaces()))
+                    if use_optimizer:
+                        prepared = optimize(prepared, target)
+                    results = target.query(prepared)
+                    rows = list(results)
+                    # Resolve each distinct term's label once, then build column by column
+                    columns = {}
+                    for i, var in enumerate(results.vars):
+                        column = [row[i] for row in rows]
+                        display = index.display_values(column)
+                        columns[str(var)] = [display.get(value) for value in column]
+                    results_df = pd.DataFrame(columns)
                     
-                    if results_list:
+                    if not results_df.empty:
                         st.success("Query executed successfully!")
-                        st.dataframe(pd.DataFrame(results_list))
+                        st.dataframe(results_df)
                     else:
                         st.info("Query executed successfully, but no results were found.")
                 except Exception as e:
@@ -281,61 +307,12 @@ if st.session_state.graph is not None:
     
     with tab4:
         st.subheader("Example SPARQL Queries")
-        st.markdown("""
-        Here are some example queries you can try:
-        
-        **1. List all products and their prices:**
-        ```sparql
-        SELECT ?product ?price
-        WHERE {
-            ?p a <http://webprotege.stanford.edu/R8JN9OAQRp5oI4RTqxxD5w8> ;
-               rdfs:label ?product ;
-               <http://webprotege.stanford.edu/RX1EIoIlDlnw04HOLQvOn5> ?price .
-        }
-        ```
-        
-        **2. Find all orders and their status:**
-        ```sparql
-        SELECT ?order ?status
-        WHERE {
-            ?o a <http://webprotege.stanford.edu/R7ov25FBIgKeXhWYXPEj1Ek> ;
-               rdfs:label ?order ;
-               <http://webprotege.stanford.edu/RK7sV7gFzu0dZNM607ho1y> ?status .
-        }
-        ```
-        
-        **3. List all users and their roles:**
-        ```sparql
-        SELECT ?user ?email ?role
-        WHERE {
-            ?u a <http://webprotege.stanford.edu/RCDV3qJJ1DAbDbX7qBz5jUi> ;
-               rdfs:label ?user ;
-               <http://webprotege.stanford.edu/RDWXxGjYsCGV4ZCWkZKCYlt> ?email ;
-               <http://webprotege.stanford.edu/RDm6E5QkiPPy7MSp1lmUjkn> ?role .
-        }
-        ```
-        
-        **4. Find all product reviews and ratings:**
-        ```sparql
-        SELECT ?product ?rating ?comment
-        WHERE {
-            ?r a <http://webprotege.stanford.edu/R7f02opMCTF0ty77OqhVpMY> ;
-               <http://webprotege.stanford.edu/RDYnxwoVn6L224Ck4eZvlI2> ?p ;
-               <http://webprotege.stanford.edu/RMn347iR5qdPSx9qM5WxEf> ?rating ;
-               <http://webprotege.stanford.edu/RBwIrRJM9TFRo7rB20yeiYH> ?comment .
-            ?p rdfs:label ?product .
-        }
-        ```
-        
-        **5. List all payments and their methods:**
-        ```sparql
-        SELECT ?payment ?method ?amount ?date
-        WHERE {
-            ?p a <http://webprotege.stanford.edu/RDonsgcbIVN6ZlHAMZjsYzQ> ;
-               rdfs:label ?payment ;
-               <http://webprotege.stanford.edu/R7w5EqCThkGttfTtndrTgRl> ?method ;
-               <http://webprotege.stanford.edu/RDM3I85VLUM29EMGRlmypWI> ?amount ;
-               <http://webprotege.stanford.edu/RDNfrR7G7Dx04C2I8EJlXAc> ?date .
-        }
-        ```
-        """)
+        st.markdown("Here are some example queries you can try:")
+        for i, (title, example) in enumerate(EXAMPLE_QUERIES, 1):
+            st.markdown(f"**{i}. {title}**")
+            st.code(example, language='sparql')
+            with st.expander("Query plan"):
+                try:
+                    st.code(explain(prepare_query(example, tuple(g.namespaces())), g))
+                except Exception as e:
+                    st.error(f"Error planning query: {str(e)}")
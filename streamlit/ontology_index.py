@@ -0,0 +1,121 @@
+"""Precomputed lookup tables for the ontology explorer
+
+Built once per uploaded graph so Streamlit reruns only read from dicts
+instead of rescanning the triples. When given the triples inferred by
+src/inference.py, instances of subclasses and relations through
+subproperties or inverse properties are included as well.
+"""
+
+from collections import defaultdict
+
+from rdflib import RDF, OWL, RDFS, URIRef
+
+
+class OntologyIndex:
+    def __init__(self, graph, inferred=None):
+        self.graph = graph
+        self.inferred = inferred
+        sources = [graph] if inferred is None else [graph, inferred]
+        self.labels = {}
+        self.comments = {}
+        self.types = defaultdict(set)
+        self.by_type = defaultdict(set)
+
+        for s, label in graph.subject_objects(RDFS.label):
+            self.labels.setdefault(s, str(label))
+        for s, comment in graph.subject_objects(RDFS.comment):
+            self.comments.setdefault(s, str(comment))
+        for source in sources:
+            for s, o in source.subject_objects(RDF.type):
+                self.types[s].add(o)
+                self.by_type[o].add(s)
+        domains = dict(graph.subject_objects(RDFS.domain))
+        ranges = dict(graph.subject_objects(RDFS.range))
+
+        # Classes with a label, keyed by URI
+        self.classes = {}
+        for s in self.by_type[OWL.Class] | self.by_type[RDFS.Class]:
+            if s in self.labels:
+                self.classes[str(s)] = self.labels[s]
+
+        # Labelled instances of those classes
+        self.instances = {}
+        for s, types in self.types.items():
+            if s not in self.labels:
+                continue
+            known = [o for o in types if isinstance(o, URIRef) and str(o) in self.classes]
+            if not known:
+                continue
+            # Show the asserted class rather than a superclass it was inferred from
+            direct = [o for o in known if (s, RDF.type, o) in graph]
+            self.instances[str(s)] = {
+                'uri': str(s),
+                'label': self.labels[s],
+                'class': self.classes[str((direct or known)[0])],
+                'classes': sorted(self.classes[str(o)] for o in known)
+            }
+
+        # Object properties linking two known classes
+        self.class_relations = []
+        for prop, domain in graph.subject_objects(RDFS.domain):
+            if str(domain) not in self.classes or OWL.ObjectProperty not in self.types.get(prop, ()):
+                continue
+            range_class = ranges.get(prop)
+            if prop in self.labels and range_class is not None and str(range_class) in self.classes:
+                self.class_relations.append({
+                    'source': self.classes[str(domain)],
+                    'predicate': self.labels[prop],
+                    'target': self.classes[str(range_class)]
+                })
+
+        # Relations between instances, walking only the instances' own triples
+        self.instance_relations = []
+        for uri, instance in self.instances.items():
+            edges = (pair for source in sources for pair in source.predicate_objects(URIRef(uri)))
+            for p, o in edges:
+                if not isinstance(o, URIRef) or p in (RDF.type, RDFS.label):
+                    continue
+                target = self.instances.get(str(o))
+                if target is not None and p in self.labels:
+                    self.instance_relations.append({
+                        'source': instance['label'],
+                        'predicate': self.labels[p],
+                        'target': target['label']
+                    })
+
+        self.class_table = [
+            {
+                'URI': str(s),
+                'Label': self.labels[s],
+                'Comment': self.comments.get(s, '')
+            }
+            for s in self.by_type[OWL.Class] | self.by_type[RDFS.Class] if s in self.labels
+        ]
+        self.object_property_table = [
+            self._property_row(s, domains.get(s), ranges.get(s), range_label=True)
+            for s in self.by_type[OWL.ObjectProperty] if s in self.labels
+        ]
+        self.data_property_table = [
+            self._property_row(s, domains.get(s), ranges.get(s), range_label=False)
+            for s in self.by_type[OWL.DatatypeProperty] if s in self.labels
+        ]
+
+    def _property_row(self, prop, domain, range_, range_label):
+        domain_label = self.labels.get(domain) if domain is not None else None
+        range_text = self.labels.get(range_) if range_label and range_ is not None else None
+        return {
+            'URI': str(prop),
+            'Label': self.labels[prop],
+            'Domain': domain_label or str(domain),
+            'Range': range_text or str(range_),
+            'Comment': self.comments.get(prop, '')
+        }
+
+    def label(self, term):
+        """Label of a term, or None"""
+        return self.labels.get(term)
+
+    def display_values(self, terms):
+        """Map each distinct term to its label, falling back to its string form"""
+        labels = self.labels
+        return {term: labels.get(term) or str(term) for term in set(terms) if term is not None}
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+from rdflib import Graph, Literal, Namespace
+
+from inference import (AXIOMS, DOMAIN, EQUIVALENT_CLASS, EQUIVALENT_PROPERTY, INVERSE, RANGE,
+                       SUBCLASS, SUBPROPERTY, SYMMETRIC, TRANSITIVE, TYPE, Reasoner, materialize)
+
+EX = Namespace("http://ex.org/")
+
+
+def random_triples(rng, count):
+    classes = [EX[f"C{i}"] for i in range(5)]
+    properties = [EX[f"p{i}"] for i in range(4)]
+    individuals = [EX[f"i{i}"] for i in range(8)]
+    schema = [
+        (classes, SUBCLASS, classes),
+        (properties, SUBPROPERTY, properties),
+        (properties, DOMAIN, classes),
+        (properties, RANGE, classes),
+        (properties, INVERSE, properties),
+        (properties, TYPE, [SYMMETRIC, TRANSITIVE]),
+        (classes, EQUIVALENT_CLASS, classes),
+        (properties, EQUIVALENT_PROPERTY, properties),
+    ]
+    triples = set()
+    for _ in range(count):
+        r = rng.random()
+        if r < 0.45:
+            subjects, predicate, objects = rng.choice(schema)
+            triples.add((rng.choice(subjects), predicate, rng.choice(objects)))
+        elif r < 0.6:
+            triples.add((rng.choice(individuals), TYPE, rng.choice(classes)))
+        elif r < 0.7:
+            triples.add((rng.choice(individuals), rng.choice(properties), Literal(rng.randint(0, 3))))
+        else:
+            triples.add((rng.choice(individuals), rng.choice(properties), rng.choice(individuals)))
+    return triples
+
+
+def naive_fixpoint(explicit):
+    """Inferred triples found by re-applying every rule to every fact until nothing changes"""
+    reasoner = Reasoner(Graph())
+    known = set(explicit) | set(AXIOMS)
+    for triple in known:
+        reasoner._index(triple)
+    changed = True
+    while changed:
+        changed = False
+        for triple in list(reasoner.facts):
+            for derived in list(reasoner._consequences(triple)):
+                if derived not in reasoner.facts:
+                    reasoner._index(derived)
+                    changed = True
+    return reasoner.facts - known
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_incremental_matches_naive_fixpoint(seed):
+    rng = random.Random(seed)
+    graph = Graph()
+    for triple in random_triples(rng, rng.randint(5, 40)):
+        graph.add(triple)
+    reasoner = Reasoner(graph)
+    assert set(reasoner.inferred) == naive_fixpoint(graph)
+
+    reasoner.add(random_triples(rng, 10))
+    assert set(reasoner.inferred) == naive_fixpoint(graph)
+
+    reasoner.remove(rng.sample(sorted(graph), min(len(graph), rng.randint(1, 8))))
+    assert set(reasoner.inferred) == naive_fixpoint(graph)
+
+
+def test_materialize_is_per_graph():
+    first, second = Graph(), Graph()
+    for graph in (first, second):
+        graph.add((EX.a, TYPE, EX.C))
+        graph.add((EX.C, SUBCLASS, EX.D))
+    reasoner = materialize(first, key='same-content')
+    assert materialize(first, key='same-content') is reasoner
+    other = materialize(second, key='same-content')
+    assert other is not reasoner and other.graph is second
+    other.remove([(EX.a, TYPE, EX.C)])
+    assert (EX.a, TYPE, EX.C) in first
+    assert (EX.a, TYPE, EX.D) in reasoner.inferred
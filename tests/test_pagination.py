@@ -0,0 +1,45 @@
+import pytest
+from rdflib import Graph, Literal, Namespace
+
+from pagination import ensure_order, paginate
+from rdf_utils import json_term
+
+EX = Namespace("http://ex.org/")
+
+
+class GraphClient:
+    """Answers SELECT queries from a local graph, like SPARQLClient.query"""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def query(self, query_string, ttl=None):
+        result = self.graph.query(query_string)
+        return [{str(var): json_term(row[var]) for var in result.vars if row[var] is not None}
+                for row in result]
+
+
+@pytest.fixture(scope='module')
+def client():
+    g = Graph()
+    for i in range(50):
+        g.add((EX[f"s{i}"], EX.p, Literal(i % 5)))
+    return GraphClient(g)
+
+
+def test_keyset_pagination_on_iri_key(client):
+    rows = list(paginate(client, "SELECT ?s ?o WHERE { ?s <http://ex.org/p> ?o }", page_size=7, key='s'))
+    assert sorted(row['s']['value'] for row in rows) == sorted(f"http://ex.org/s{i}" for i in range(50))
+
+
+def test_offset_pagination_with_ties(client):
+    query = "SELECT ?s ?o WHERE { ?s <http://ex.org/p> ?o } ORDER BY DESC(?o)"
+    rows = list(paginate(client, query, page_size=7))
+    assert len({row['s']['value'] for row in rows}) == 50
+    assert [row['o']['value'] for row in rows] == sorted((row['o']['value'] for row in rows), reverse=True)
+
+
+def test_ensure_order_adds_tie_breakers():
+    assert ensure_order("SELECT ?a ?b WHERE { ?a ?p ?b } ORDER BY DESC(?b)") == \
+        "SELECT ?a ?b WHERE { ?a ?p ?b } ORDER BY DESC(?b) ?a"
+    assert ensure_order("SELECT ?a WHERE { ?a ?p ?b }") == "SELECT ?a WHERE { ?a ?p ?b }\nORDER BY ?a"
@@ -0,0 +1,40 @@
+import pytest
+from rdflib import Graph, Literal, Namespace, RDF
+
+from query_optimizer import optimize
+from rdf_utils import prepare_query
+
+EX = Namespace("http://ex.org/")
+
+QUERIES = [
+    "SELECT ?s ?v WHERE { ?s ex:p ?v FILTER NOT EXISTS { ?s ex:q ?x } }",
+    "SELECT ?s ?v WHERE { ?s ex:p ?v FILTER EXISTS { ?s ex:r ?x } }",
+    "SELECT ?s WHERE { ?s ex:p ?v FILTER(?v > 5 && NOT EXISTS { ?s ex:q ?x }) }",
+    "SELECT ?s ?x WHERE { ?s ex:p ?v OPTIONAL { ?s ex:q ?x } FILTER(!BOUND(?x)) }",
+    "SELECT ?s ?d WHERE { ?s ex:p ?v BIND(?v * 2 AS ?d) FILTER(?d > 10 && ?v < 12) }",
+    "SELECT ?s WHERE { { ?s ex:q ?x } UNION { ?s ex:r ?x } ?s ex:p ?v FILTER(?v < 20) }",
+    "SELECT ?c (COUNT(?s) AS ?n) WHERE { ?s a ?c ; ex:p ?v } GROUP BY ?c HAVING(COUNT(?s) > 5)",
+    "SELECT ?s ?t WHERE { ?s a ex:Thing ; ex:p ?v ; ex:q ?x . ?x ex:p ?t FILTER(?v = ?t || ?t > 3) }",
+]
+
+
+@pytest.fixture(scope='module')
+def graph():
+    g = Graph()
+    g.bind('ex', EX)
+    for i in range(30):
+        s = EX[f"s{i}"]
+        g.add((s, RDF.type, EX.Thing if i % 4 else EX.Other))
+        g.add((s, EX.p, Literal(i)))
+        if i % 3 == 0:
+            g.add((s, EX.q, EX[f"s{(i * 7) % 30}"]))
+        if i % 5 == 0:
+            g.add((s, EX.r, Literal(i)))
+    return g
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_optimized_results_match(graph, query):
+    prepared = prepare_query(query, graph.namespaces())
+    expected = sorted(map(tuple, graph.query(prepared)))
+    assert sorted(map(tuple, graph.query(optimize(prepared, graph)))) == expected